@@ -0,0 +1,189 @@
+"""
+Author: LilacDogoo
+
+Headless benchmarks of everything that does not need Blender: parsing (whole file and streamed), material
+deduplication, duplicate triangle culling, the scene cache and the alpha map scan. Runs on synthetic dumps written by 'synthetic_wrl.py'.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 1000 10000 100000 1000000] [--json results.json]
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 1.25
+
+Times are measured without tracing. Peak memory is measured in a second, traced run (tracemalloc also sees NumPy
+allocations). With --baseline the run fails when a phase got slower than 'tolerance' times the baseline, or when the
+streaming and legacy parsers stop producing the same scene (also for a dump without a final newline).
+"""
+from typing import Callable, Dict, List
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lilacdogoo_blender_import_wrl import wrl_parser, scene_cache, texture_files, mesh_arrays  # noqa: E402
+from synthetic_wrl import write_synthetic_wrl  # noqa: E402
+
+
+def measure(function: Callable, trace_memory: bool = True) -> Dict[str, float]:
+    """Runs 'function' once untraced for its time and once traced for its peak memory."""
+    gc.collect()
+    time_start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - time_start
+    peak = 0
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak / (1 << 20)}
+
+
+def scenes_equal(A: wrl_parser.PreBlender_Scene, B: wrl_parser.PreBlender_Scene) -> bool:
+    if len(A.meshes) != len(B.meshes) or len(A.materials) != len(B.materials): return False
+    for a, b in zip(A.materials, B.materials):
+        if wrl_parser.preBlender_Material_key(a) != wrl_parser.preBlender_Material_key(b) or a.name != b.name: return False
+    for a, b in zip(A.meshes, B.meshes):
+        if a.name != b.name or a.material.index != b.material.index: return False
+        for field in ("points", "texcoords", "colors"):
+            if not np.array_equal(getattr(a, field), getattr(b, field)): return False
+    return True
+
+
+def benchmark_size(directory: str, triangles: int, legacy: bool) -> Dict[str, dict]:
+    filepath = write_synthetic_wrl(directory, "output.wrl", triangles, textures=True)
+    megabytes = os.path.getsize(filepath) / (1 << 20)
+    results: Dict[str, dict] = {}
+
+    def add(phase: str, r: Dict[str, float], megabytes_processed: float = None):
+        if megabytes_processed is not None: r["mb_per_second"] = megabytes_processed / max(r["seconds"], 1e-9)
+        r["triangles_per_second"] = triangles / max(r["seconds"], 1e-9)
+        results[phase] = r
+
+    add("parse", measure(lambda: wrl_parser.read_wrl_file(directory, "output.wrl")), megabytes)
+    # The same parse through the bounded Shape queue of a streaming import. Every Shape is dropped as soon as it comes out.
+    def parse_streamed():
+        stream = wrl_parser.WRL_Shape_Stream(directory, "output.wrl", depth=16)
+        try:
+            return sum(1 for _ in stream)
+        finally:
+            stream.close()
+    add("parse_streamed", measure(parse_streamed), megabytes)
+
+    scene = wrl_parser.read_wrl_file(directory, "output.wrl")
+    results["scene"] = {"shapes": len(scene.meshes), "materials": len(scene.materials), "deduplicated_shapes": scene.deduplicated_shapes, "file_mb": megabytes}
+
+    # Material deduplication on its own, fed with copies of already parsed Shapes ('scene' itself stays untouched)
+    pairs = [(mesh, mesh.material) for mesh in scene.meshes]
+
+    def deduplicate():
+        S = wrl_parser.PreBlender_Scene()
+        for mesh, material in pairs:
+            mesh_copy = wrl_parser.PreBlender_Mesh()
+            mesh_copy.__dict__.update(mesh.__dict__)
+            copy = wrl_parser.PreBlender_Material()
+            copy.__dict__.update(material.__dict__)
+            copy.index, copy.first_mesh_linked = -1, None
+            wrl_parser.scene_add_shape(S, mesh_copy, copy)
+        return S
+    add("deduplicate_materials", measure(deduplicate))
+
+    # Duplicate triangle culling of the whole scene against an empty index (the lookups cost the same when nothing is found)
+    def cull_duplicates():
+        index = mesh_arrays.Triangle_Index(1e-4)
+        return sum(mesh_arrays.cull_duplicate_triangles(mesh_arrays.from_preBlender_mesh(mesh), index) for mesh in scene.meshes)
+    add("cull_duplicates", measure(cull_duplicates))
+
+    if legacy:
+        add("parse_legacy", measure(lambda: wrl_parser.read_wrl_file_legacy(directory, "output.wrl")), megabytes)
+        results["parsers_match"] = scenes_equal(scene, wrl_parser.read_wrl_file_legacy(directory, "output.wrl"))
+        # The same dump without the newline after its final '}'
+        with open(filepath, 'rb') as f: content = f.read()
+        with open(os.path.join(directory, "no_final_newline.wrl"), 'wb') as f: f.write(content.rstrip())
+        results["no_final_newline_matches"] = scenes_equal(scene, wrl_parser.read_wrl_file(directory, "no_final_newline.wrl"))
+
+    key = scene_cache.file_key(filepath)
+    cache_filepath = scene_cache.cache_path(filepath)
+    add("cache_key", measure(lambda: scene_cache.file_key(filepath), trace_memory=False), megabytes)
+    add("cache_save", measure(lambda: scene_cache.save_scene_cache(scene, cache_filepath, key), trace_memory=False))
+    add("cache_load", measure(lambda: scene_cache.load_scene_cache(cache_filepath, key)))
+    results["cache_matches"] = scenes_equal(scene, scene_cache.load_scene_cache(cache_filepath, key))
+
+    alpha_maps: List[str] = [os.path.join(directory, F) for F in os.listdir(directory) if "_a." in F]
+    alpha_megabytes = sum(os.path.getsize(P) for P in alpha_maps) / (1 << 20)
+    add("alpha_scan", measure(lambda: [texture_files.is_BMP_valid_transparency(P) for P in alpha_maps], trace_memory=False), alpha_megabytes)
+
+    def alpha_scan_cached():
+        cache = texture_files.Texture_File_Cache(directory)
+        [cache.has_transparency(P) for P in alpha_maps]
+        return cache
+    alpha_scan_cached().save()  # Fill the cache file, every measured call then loads it and reads no alpha map
+    add("alpha_scan_cached", measure(alpha_scan_cached, trace_memory=False), alpha_megabytes)
+    results["alpha_cache_used"] = alpha_scan_cached().files_scanned == 0
+    return results
+
+
+def compare_to_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    failures: List[str] = []
+    for size, phases in results.items():
+        for check in ("parsers_match", "no_final_newline_matches", "cache_matches", "alpha_cache_used"):
+            if phases.get(check) is False: failures.append("%s triangles: %s is False" % (size, check))
+        for phase, r in phases.items():
+            B = baseline.get(size, {}).get(phase)
+            if not isinstance(r, dict) or not isinstance(B, dict) or "seconds" not in B: continue
+            if r["seconds"] > B["seconds"] * tolerance:
+                failures.append("%s triangles: %s took %.4fs, baseline %.4fs" % (size, phase, r["seconds"], B["seconds"]))
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the bpy free parts of the WRL importer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="Triangle counts")
+    parser.add_argument("--legacy-max", type=int, default=100000, help="Largest size that also runs the legacy parser")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed slowdown compared to the baseline")
+    parser.add_argument("--keep", help="Write the dumps into this directory instead of a temporary one")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, dict] = {}
+    for size in args.sizes:
+        directory = os.path.join(args.keep, str(size)) if args.keep else tempfile.mkdtemp(prefix="wrl_benchmark_")
+        try:
+            results[str(size)] = benchmark_size(directory, size, size <= args.legacy_max)
+        finally:
+            if not args.keep: shutil.rmtree(directory, ignore_errors=True)
+        print("%d triangles (%.1f MB, %d shapes)" % (size, results[str(size)]["scene"]["file_mb"], results[str(size)]["scene"]["shapes"]))
+        for phase, r in results[str(size)].items():
+            if isinstance(r, dict) and "seconds" in r:
+                line = "    %-22s %9.4f s  %9.0f tri/s" % (phase, r["seconds"], r["triangles_per_second"])
+                if "mb_per_second" in r: line += "  %8.1f MB/s" % r["mb_per_second"]
+                if r.get("peak_mb"): line += "  peak %8.1f MB" % r["peak_mb"]
+                print(line)
+            elif not isinstance(r, dict):
+                print("    %-22s %s" % (phase, r))
+
+    if args.json:
+        with open(args.json, 'w', encoding='UTF-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='UTF-8') as f:
+            failures = compare_to_baseline(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print("REGRESSION: " + failure)
+        if failures: return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
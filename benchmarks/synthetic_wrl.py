@@ -0,0 +1,119 @@
+"""
+Author: LilacDogoo
+
+Writes synthetic "Nemu64 Graphics" VRML dumps for benchmarking. The layout (Shape / appearance / geometry / coord /
+texCoord / color blocks) is the same one 'read_wrl_file' reads from real dumps. Nothing in here needs Blender.
+
+Usage:
+    python benchmarks/synthetic_wrl.py <output directory> --triangles 100000 [--textures]
+"""
+from typing import TextIO
+
+import os
+import sys
+import struct
+import argparse
+
+import numpy as np
+
+
+def write_bmp(path: str, width: int, height: int, pixels: np.ndarray):
+    """pixels: (height, width, 3) uint8. Writes a plain 24 bit BMP."""
+    row_padding = -(width * 3) % 4
+    rows = np.zeros((height, width * 3 + row_padding), dtype=np.uint8)
+    rows[:, :width * 3] = pixels.reshape(height, width * 3)
+    data = rows.tobytes()
+    with open(path, 'wb') as f:
+        f.write(b"BM" + struct.pack("<IHHI", 54 + len(data), 0, 0, 54))
+        f.write(struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0, len(data), 0, 0, 0, 0))
+        f.write(data)
+
+
+def _write_rows(f: TextIO, values: np.ndarray, indent: str):
+    # One "a b c," line per row, exactly like the dump
+    fmt = indent + " ".join(["%.6f"] * values.shape[1]) + ","
+    np.savetxt(f, values, fmt=fmt)
+
+
+def write_synthetic_wrl(directory: str, filename: str = "output.wrl", triangles: int = 10000, triangles_per_shape: int = 64,
+                        materials: int = 32, textures: bool = False, texture_size: int = 256, seed: int = 0) -> str:
+    """Writes a dump with about 'triangles' triangles split into Shapes of 'triangles_per_shape'.
+    Even material numbers use a texture (texCoord block), odd ones use vertex colors (color block), just like real
+    dumps where a Shape has one or the other. With 'textures' the matching _c. and _a. BMP files are written too;
+    half of the alpha maps are completely black so the alpha scan has to read them to the end.
+    Returns the path of the .wrl file."""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    filepath = os.path.join(directory, filename)
+    shape_count = -(-triangles // triangles_per_shape)
+    with open(filepath, 'w', encoding='UTF-8', newline='\n') as f:
+        f.write("#VRML V2.0 utf8\n\n")
+        remaining = triangles
+        for s in range(shape_count):
+            tris = min(triangles_per_shape, remaining)
+            remaining -= tris
+            m = int(rng.integers(materials))
+            textured = m % 2 == 0
+            f.write("Shape {\n")
+            f.write("\tappearance DEF Material_%d Appearance {\n" % s)
+            f.write("\t\tmaterial Material {\n")
+            f.write("\t\t\tambientIntensity %.6f\n" % (1.0 if m % 3 else 0.5))
+            f.write("\t\t\tdiffuseColor %.6f %.6f %.6f\n" % (1.0, 1.0 - (m % 5) * 0.1, 1.0))
+            f.write("\t\t\tspecularColor 0.000000 0.000000 0.000000\n")
+            f.write("\t\t\temissiveColor 0.000000 0.000000 0.000000\n")
+            f.write("\t\t\tshininess 0.000000\n")
+            f.write("\t\t\ttransparency 0.000000\n")
+            f.write("\t\t}\n")
+            if textured:
+                f.write("\t\ttexture ImageTexture {\n")
+                f.write("\t\t\turl \"synthetic_%d_c.bmp\"\n" % m)
+                f.write("\t\t\trepeatS TRUE\n")
+                f.write("\t\t\trepeatT TRUE\n")
+                f.write("\t\t}\n")
+            f.write("\t}\n")
+            f.write("\tgeometry DEF Shape_%d IndexedFaceSet {\n" % s)
+            f.write("\t\tcoord Coordinate {\n\t\t\tpoint [\n")
+            _write_rows(f, rng.uniform(-1000.0, 1000.0, (tris * 3, 3)), "\t\t\t\t")
+            f.write("\t\t\t]\n\t\t}\n")
+            if textured:
+                f.write("\t\ttexCoord TextureCoordinate {\n\t\t\tpoint [\n")
+                _write_rows(f, rng.uniform(0.0, 4.0, (tris * 3, 2)), "\t\t\t\t")
+                f.write("\t\t\t]\n\t\t}\n")
+            else:
+                f.write("\t\tcolor Color {\n\t\t\tcolor [\n")
+                _write_rows(f, rng.uniform(0.0, 1.0, (tris * 3, 3)), "\t\t\t\t")
+                f.write("\t\t\t]\n\t\t}\n")
+            f.write("\t\tcoordIndex [\n\t\t\t")
+            f.write(" ".join("%d, %d, %d, -1," % (i, i + 1, i + 2) for i in range(0, tris * 3, 3)))
+            f.write("\n\t\t]\n")
+            f.write("\t}\n")
+            f.write("}\n\n")
+
+    if textures:
+        for m in range(0, materials, 2):
+            pixels = rng.integers(0, 256, (texture_size, texture_size, 3), dtype=np.uint8)
+            write_bmp(os.path.join(directory, "synthetic_%d_c.bmp" % m), texture_size, texture_size, pixels)
+            alpha = np.zeros((texture_size, texture_size, 3), dtype=np.uint8)
+            if (m // 2) % 2 == 1: alpha[-1, -1] = 255  # Transparency in the very last pixel row written
+            write_bmp(os.path.join(directory, "synthetic_%d_a.bmp" % m), texture_size, texture_size, alpha)
+    return filepath
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Nemu64 VRML dump.")
+    parser.add_argument("directory")
+    parser.add_argument("--filename", default="output.wrl")
+    parser.add_argument("--triangles", type=int, default=10000)
+    parser.add_argument("--triangles-per-shape", type=int, default=64)
+    parser.add_argument("--materials", type=int, default=32)
+    parser.add_argument("--textures", action="store_true", help="Also write the _c. and _a. BMP files")
+    parser.add_argument("--texture-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    path = write_synthetic_wrl(args.directory, args.filename, args.triangles, args.triangles_per_shape, args.materials,
+                               args.textures, args.texture_size, args.seed)
+    print("%s (%.1f MB)" % (path, os.path.getsize(path) / (1 << 20)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,20 +21,30 @@ debug = False
 if "bpy" in locals():
     import importlib
     import lilacdogoo_blender_import_wrl
+    importlib.reload(lilacdogoo_blender_import_wrl.import_stats)
+    importlib.reload(lilacdogoo_blender_import_wrl.wrl_parser)
+    importlib.reload(lilacdogoo_blender_import_wrl.scene_cache)
+    importlib.reload(lilacdogoo_blender_import_wrl.texture_files)
+    importlib.reload(lilacdogoo_blender_import_wrl.mesh_arrays)
     importlib.reload(lilacdogoo_blender_import_wrl.file_wrl)
 else:
-    from lilacdogoo_blender_import_wrl import file_wrl
-
-import bpy
+    try:
+        import bpy
+    except ImportError:
+        bpy = None  # Not inside Blender (e.g. a parsing worker process). Only the modules that do not use bpy are available.
+    if bpy is not None:
+        from lilacdogoo_blender_import_wrl import file_wrl
 
 
 def menu_func_import(self, context):
     self.layout.operator(file_wrl.BlenderOperator_wrl_import.bl_idname, text="N64 vrml (.wrl)")
+    self.layout.operator(file_wrl.BlenderOperator_wrl_import_modal.bl_idname, text="N64 vrml (.wrl) in background")
 
 
 _classes = (
     file_wrl.BlenderOperator_wrl_import,
-)
+    file_wrl.BlenderOperator_wrl_import_modal,
+) if bpy is not None else ()
 
 
 def register():
@@ -6,28 +6,35 @@ This also hold all the capabilities of reading NinjaRipper [RIP] files into a 'P
 
 This script was written by me (LilacDogoo).
 """
-from typing import List, TextIO, BinaryIO
+from typing import List, Dict, Iterator, Tuple
 
 import os
+import sys
 import time
+import queue
 import random
+import threading
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
 
 import bpy
-import bmesh
 
 import lilacdogoo_blender_import_wrl
+from lilacdogoo_blender_import_wrl import texture_files, mesh_arrays
+from lilacdogoo_blender_import_wrl.import_stats import Import_Stats
+from lilacdogoo_blender_import_wrl.wrl_parser import PreBlender_Material, PreBlender_Mesh, PreBlender_Scene, WRL_Shape_Stream, read_wrl_file, read_wrl_file_appended
+from lilacdogoo_blender_import_wrl.scene_cache import read_wrl_file_cached
 
 
-class BlenderOperator_wrl_import(bpy.types.Operator):
-    bl_idname = "import_scene.wrl"
-    bl_label = "N64 VRML Importer"
-    bl_description = "Import Models from Nemu64 vrml dumps."
-    bl_options = {'UNDO'}
-
+class WRL_Import_Properties:
+    """Every option of the importer. Blender only collects property annotations from the operator class itself and
+    from bases that are not bpy types, so both operators get them from this plain class."""
     # Properties used by the file browser
     filepath: bpy.props.StringProperty(name="File Path", description="The file path used for importing the wrl file",
                                        maxlen=1024, default="", options={'HIDDEN'})
-    files: bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN'})  # ????
+    files: bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN'})  # Every selected file, imported as a batch
     directory: bpy.props.StringProperty(maxlen=1024, default="", subtype='FILE_PATH', options={'HIDDEN'})
     filter_folder: bpy.props.BoolProperty(name="Filter Folders", description="", default=True, options={'HIDDEN'})
     filter_glob: bpy.props.StringProperty(default="*.wrl", options={'HIDDEN'})
@@ -41,420 +48,931 @@ class BlenderOperator_wrl_import(bpy.types.Operator):
     #                                                       description="Attempts to load textures.",
     #                                                       default=True)
 
+    p_deduplicate_textures: bpy.props.BoolProperty(name="Deduplicate Textures",
+                                                   description="Compare texture files by content instead of by filename. The same texels dumped under different names are loaded as one image, and with 'Reuse Materials' their materials are shared too. Every texture is hashed once, the result is remembered in 'wrl_texture_cache.json'.",
+                                                   default=True)
+
     p_cull_back_facing: bpy.props.BoolProperty(name="Cull Backfaces",
                                                description="Generally enabled for video games models. Keep in mind, Models from these games are intended to 'back-face cull. Faces will exist in the exact same positions but have opposite normals.",
                                                default=True)
 
+    p_legacy_parser: bpy.props.BoolProperty(name="Legacy Parser",
+                                            description="Use the original line by line parser instead of the streaming tokenizer. Only useful for comparing the two. The scene cache is neither read nor written.",
+                                            default=False)
+
+    p_ignore_cache: bpy.props.BoolProperty(name="Ignore Cache",
+                                           description="Always parse the .wrl text. The scene cache file next to it is neither read nor written.",
+                                           default=False)
+
+    p_rebuild_cache: bpy.props.BoolProperty(name="Rebuild Cache",
+                                            description="Parse the .wrl text even if a valid scene cache exists, then overwrite the cache.",
+                                            default=False)
+
+    p_weld_vertices: bpy.props.BoolProperty(name="Weld Vertices",
+                                            description="The dump has 3 separate vertices for every triangle. Merge vertices that share a position. UVs and vertex colors are kept per face corner so nothing changes visually.",
+                                            default=False)
+
+    p_weld_distance: bpy.props.FloatProperty(name="Weld Distance",
+                                             description="Vertices closer than this are merged into the first of them, as with 'Merge by Distance'. 0 only merges exactly equal positions.",
+                                             default=0.0001, min=0.0, precision=5, subtype='DISTANCE')
+
+    p_duplicate_geometry: bpy.props.EnumProperty(name="Duplicate Geometry",
+                                                 description="What to do with Shapes whose geometry and material already exist from an earlier import",
+                                                 items=(('NEW', "Create New Mesh", "Always create a new mesh (every rip gets its own copy)"),
+                                                        ('LINK', "Link Existing Mesh", "Create a new object that uses the existing mesh data"),
+                                                        ('SKIP', "Skip", "Do not import the Shape at all")),
+                                                 default='NEW')
+
+    p_cull_duplicate_triangles: bpy.props.BoolProperty(name="Cull Duplicate Triangles",
+                                                       description="Overlapping rips dump the same triangles again inside differently batched Shapes. Drop every triangle that already exists in a 'WRL Import' Collection (or earlier in this import). Back faces (opposite winding) are kept.",
+                                                       default=False)
+
+    p_cull_distance: bpy.props.FloatProperty(name="Duplicate Distance",
+                                             description="Triangles count as duplicates when their corners round to the same grid of this size",
+                                             default=0.0001, min=0.000001, precision=6, subtype='DISTANCE')
+
+    p_merge_by_material: bpy.props.BoolProperty(name="Merge by Material",
+                                                description="Build one object per material instead of one per Shape. Much faster to work with for big rips. The face attribute 'wrl_shape_index' (an index into the mesh property 'wrl_shape_names') remembers which Shape every face came from.",
+                                                default=False)
+
+    p_append_new_shapes: bpy.props.BoolProperty(name="Append New Shapes",
+                                                description="Only import the Shapes that were added to the file since it was last imported with this option (e.g. while the emulator is still dumping). They go into the Collection of that import. The whole file is imported again if its beginning changed.",
+                                                default=False)
+
+    p_stream_shapes: bpy.props.BoolProperty(name="Stream Shapes",
+                                            description="Build every Shape as soon as it is parsed instead of parsing the whole file first, so a huge dump is never held in memory at once. Peak memory then depends on the largest Shapes, not on the file size. Files are parsed one after another and the scene cache is not used. Ignored with 'Merge by Material', 'Append New Shapes' or 'Legacy Parser'.",
+                                            default=False)
+
+    p_stream_queue_depth: bpy.props.IntProperty(name="Stream Queue Depth",
+                                                description="How many parsed Shapes may wait to be built while streaming. More lets the parser run further ahead, fewer keeps less in memory.",
+                                                default=16, min=1, max=4096)
+
+    p_profile: bpy.props.BoolProperty(name="Profile Import",
+                                      description="Print the time spent in every phase plus counters and peak memory. Also writes 'wrl_import_profile.json' and the cProfile dump 'wrl_import_profile.prof' into the VRML folder. Always on in debug mode.",
+                                      default=False)
+
+
+class WRL_Import_Steps(WRL_Import_Properties):
+    """The file browser and the import steps, shared by the blocking and the modal operator."""
     def invoke(self, context, event):
         self.directory = "C:\\VRML"
         bpy.context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
-    def execute(self, context):
-        time_start = time.time()  # Operation Timer
-
-        scene: PreBlender_Scene = read_wrl_file(directory=self.directory, filename=self.filepath)
-        to_blender(scene, self.p_reuse_materials, self.p_cull_back_facing)
+    # ▬▬ IMPORT STEPS ▬▬
+    def begin_import(self) -> Iterator[Tuple[str, PreBlender_Scene, float, bool]]:
+        """Sets up everything the files of the batch share. Returns the parsed files, see 'read_wrl_files'."""
+        self._time_start = time.time()  # Operation Timer
+        self._stats: Import_Stats = Import_Stats()
+        self._profile: bool = self.p_profile or lilacdogoo_blender_import_wrl.debug
+        if self._profile: self._stats.start_profiling()
+
+        self._filenames: List[str] = [F.name for F in self.files if F.name] or [self.filepath]
+        # Shared by every file of the batch
+        with self._stats.phase("index_blend_data"):
+            self._material_index: Blender_Material_Index = Blender_Material_Index() if self.p_reuse_materials else None
+            self._mesh_index: Blender_Mesh_Index = Blender_Mesh_Index()
+            self._image_index: Blender_Image_Index = Blender_Image_Index()
+            self._triangle_index: mesh_arrays.Triangle_Index = triangle_index_from_blender(self.p_cull_distance) if self.p_cull_duplicate_triangles else None
+        self._material_templates = Blender_Material_Templates()
+        self._texture_cache = texture_files.Texture_File_Cache(self.directory)
+
+        # Merging needs every Shape of a material at once, and the other two read the file their own way
+        self._stream: bool = self.p_stream_shapes and not (self.p_merge_by_material or self.p_append_new_shapes or self.p_legacy_parser)
+        if self._stream:
+            return read_wrl_files_streamed(self.directory, self._filenames, self.p_stream_queue_depth)
+        if self.p_append_new_shapes:
+            states = [append_state(os.path.join(self.directory, filename)) for filename in self._filenames]
+            return read_wrl_files_appended(self.directory, self._filenames, states)
+        return read_wrl_files(self.directory, self._filenames, self.p_legacy_parser, not self.p_ignore_cache, self.p_rebuild_cache)
+
+    def begin_file(self, filename: str, scene: PreBlender_Scene, time_parse: float, from_cache: bool) -> Iterator[Tuple[int, int]]:
+        """Returns the build steps of one parsed file ('to_blender_steps'), or None if there is nothing to build.
+        'scene' is a 'WRL_Shape_Stream' when streaming."""
+        stream: WRL_Shape_Stream = None
+        if isinstance(scene, WRL_Shape_Stream): stream, scene = scene, scene.scene
+        self._file = (filename, scene, time_parse, from_cache, stream)
+        if scene is None:
+            self._stats.files.append({"filename": filename, "from_cache": from_cache, "parse_seconds": time_parse, "build_seconds": 0.0})
+            print("    %s: Empty file" % filename)
+            return None
+        blender_collection: bpy.types.Collection = None
+        self._append_partial = None
+        if self.p_append_new_shapes:
+            blender_collection = find_append_collection(os.path.join(self.directory, filename))
+            if blender_collection is not None and scene.start_offset == 0:  # Rewritten, the old Collection stays as it is
+                forget_append_state(blender_collection)
+                blender_collection = None
+            if len(scene.meshes) == 0:
+                print("    %s: No new Shapes" % os.path.basename(filename))
+                return None
+            new_collection: bool = blender_collection is None
+            if new_collection:
+                blender_collection = bpy.data.collections.new("WRL Import.000")
+                bpy.context.scene.collection.children.link(blender_collection)
+            # What to remove if this file is stopped part way, see 'remove_partial_file'
+            self._append_partial = (blender_collection, set(O.name for O in blender_collection.objects), new_collection)
+        self._time_build_start = time.time()
+        return to_blender_steps(scene, self.p_reuse_materials, self.p_cull_back_facing, self._material_index, self._texture_cache,
+                                p_weld_distance=self.p_weld_distance if self.p_weld_vertices else None,
+                                p_duplicate_geometry=self.p_duplicate_geometry, mesh_index=self._mesh_index, p_merge_by_material=self.p_merge_by_material,
+                                stats=self._stats, blender_collection=blender_collection,
+                                p_deduplicate_textures=self.p_deduplicate_textures, image_index=self._image_index,
+                                p_cull_distance=self.p_cull_distance if self.p_cull_duplicate_triangles else None, triangle_index=self._triangle_index,
+                                material_templates=self._material_templates, stream=stream)
+
+    def end_file(self, blender_collection: bpy.types.Collection):
+        """Call after the steps of 'begin_file' ran to the end."""
+        filename, scene, time_parse, from_cache, stream = self._file
+        time_build = time.time() - self._time_build_start
+        if stream is not None:  # Parsed while building
+            time_parse = scene.stats.phases.get("parse", 0.0)
+            self._stats.files.append({"filename": filename, "from_cache": False, "parse_seconds": time_parse, "build_seconds": time_build})
+            self._stats.merge(scene.stats)
+            print("    %s: Streamed in %.4f seconds (%.4f seconds parsing). %d Shapes, %d Materials (%d Shapes reused a Material)" %
+                  (os.path.basename(filename), time_build, time_parse, stream.shape_count, len(scene.materials), scene.deduplicated_shapes))
+            return
+        self._stats.files.append({"filename": filename, "from_cache": from_cache, "parse_seconds": time_parse, "build_seconds": time_build})
+        self._stats.merge(scene.stats)
+        if self.p_append_new_shapes:
+            shape_count: int = save_append_state(blender_collection, os.path.join(self.directory, filename), scene)
+            print("    %s: Appended %d Shapes from bytes %d to %d, %d Shapes in '%s'" %
+                  (os.path.basename(filename), len(scene.meshes), scene.start_offset, scene.end_offset, shape_count, blender_collection.name))
+        else:
+            print("    %s: %s in %.4f seconds, Built in %.4f seconds. %d Shapes, %d Materials (%d Shapes reused a Material)" %
+                  (os.path.basename(filename), "Loaded from cache" if from_cache else "Parsed", time_parse, time_build, len(scene.meshes), len(scene.materials), scene.deduplicated_shapes))
+
+    def remove_partial_file(self):
+        """Append mode only: removes the objects a stopped file already built. Its offset is not saved, so the next
+        import reads those Shapes again and would otherwise add them to the Collection a second time."""
+        if self._append_partial is None: return
+        blender_collection, object_names, new_collection = self._append_partial
+        for O in [O for O in blender_collection.objects if O.name not in object_names]:
+            blender_mesh: bpy.types.Mesh = O.data
+            bpy.data.objects.remove(O)
+            if blender_mesh is not None and blender_mesh.users == 0: bpy.data.meshes.remove(blender_mesh)
+        if new_collection: bpy.data.collections.remove(blender_collection)
+        self._append_partial = None
+
+    def end_import(self, files_done: int):
+        self._material_templates.remove()
 
         time_end = time.time()  # Operation Timer
-        print("    Completed in %.4f seconds" % (time_end - time_start))
+        print("    Completed %d file(s) in %.4f seconds" % (files_done, time_end - self._time_start))
+        if self._profile:
+            self._stats.stop_profiling()
+            self._stats.print_report()
+            try:
+                self._stats.save_json(os.path.join(self.directory, "wrl_import_profile.json"))
+                self._stats.save_profile(os.path.join(self.directory, "wrl_import_profile.prof"))
+                print("    Profile written to " + os.path.join(self.directory, "wrl_import_profile.json"))
+            except OSError as e:
+                print("    Could not write the profile (%s)" % e)
+
+
+class BlenderOperator_wrl_import(WRL_Import_Steps, bpy.types.Operator):
+    bl_idname = "import_scene.wrl"
+    bl_label = "N64 VRML Importer"
+    bl_description = "Import Models from Nemu64 vrml dumps."
+    bl_options = {'UNDO'}
+
+    def execute(self, context):
+        files = self.begin_import()
+        for item in files:
+            steps = self.begin_file(*item)
+            if steps is not None: self.end_file(run_steps(steps))
+        self.end_import(len(self._filenames))
         return {'FINISHED'}
 
 
-class PreBlender_Material:
-    def __init__(self) -> None:
-        super().__init__()
-        self.name: str = "NoNameAssigned"
-        self.index: int = -1
-        self.ambient_intensity: float = 1
-        self.diffuse_color: (float, float, float) = (1.0, 1.0, 1.0)
-        self.specular_color: (float, float, float) = (1.0, 1.0, 1.0)  # TODO not implemented, not sure where it is even used yet
-        self.emissive_color: (float, float, float) = (0.0, 0.0, 0.0)
-        self.alpha: float = 1
-        self.texture_url: str = None
-        self.texture_repeat: bool = True
-        self.first_mesh_linked = None
+class BlenderOperator_wrl_import_modal(WRL_Import_Steps, bpy.types.Operator):
+    """Same import, but Blender keeps running: files are parsed on a background thread and built in short slices
+    between redraws. Progress is shown in the status bar. ESC stops after the object being built;
+    everything built until then stays (in append mode the objects of the stopped file are removed again, the
+    whole file is imported by the next append)."""
+    bl_idname = "import_scene.wrl_modal"
+    bl_label = "N64 VRML Importer (Background)"
+    bl_description = "Import Models from Nemu64 vrml dumps without freezing Blender. Press ESC to stop."
+    bl_options = {'UNDO'}
 
-    def __str__(self):
-        return self.name
+    TIME_SLICE = 0.05  # Seconds of building per timer event
 
+    def execute(self, context):
+        files = self.begin_import()
+        self._results: queue.Queue = queue.Queue()
+        self._stop: threading.Event = threading.Event()
+        self._files: Iterator[Tuple[str, WRL_Shape_Stream, float, bool]] = None
+        if self._stream:
+            self._files = files  # Every stream has its own parser thread. Started one at a time, when its file is built.
+        else:
+            self._thread = threading.Thread(target=parse_in_background, args=(files, self._results, self._stop), daemon=True)
+            self._thread.start()
+        self._steps: Iterator[Tuple[int, int]] = None
+        self._step: Tuple[int, int] = (0, 1)
+        self._files_done: int = 0
+        self._built: bool = False  # Something was added to the blend data
+        self._result: set = None  # Set once the import is over
+
+        # The build holds on to blend data (Collection, materials, indexes) between timer events. Undo and loading a
+        # file replace that data, so the import stops right before either happens.
+        def stop_before_undo(*args):
+            self.stop_import(bpy.context)
+        self._stop_before_undo = stop_before_undo
+        for handlers in (bpy.app.handlers.undo_pre, bpy.app.handlers.redo_pre, bpy.app.handlers.load_pre):
+            handlers.append(stop_before_undo)
+
+        window_manager: bpy.types.WindowManager = context.window_manager
+        self._timer = window_manager.event_timer_add(0.01, window=context.window)
+        window_manager.modal_handler_add(self)
+        window_manager.progress_begin(0, len(self._filenames))
+        return {'RUNNING_MODAL'}
 
-def preBlender_Material_equals(A: PreBlender_Material, B: PreBlender_Material) -> bool:
-    R = A.texture_url == B.texture_url and A.texture_repeat == B.texture_repeat and A.diffuse_color == B.diffuse_color and A.emissive_color == B.emissive_color and A.alpha == B.alpha and A.ambient_intensity == B.ambient_intensity
-    return R
+    def modal(self, context, event):
+        if self._result is not None: return self._result  # Stopped right before an undo or file load
+        if event.type == 'ESC': return self.stop_import(context)
+        if event.type != 'TIMER': return {'PASS_THROUGH'}
+
+        time_end = time.perf_counter() + BlenderOperator_wrl_import_modal.TIME_SLICE
+        while time.perf_counter() < time_end:
+            if self._steps is None:
+                try:
+                    item = self.next_file()
+                except queue.Empty:
+                    break  # The next file is still being parsed
+                except Exception as e:  # A stream could not be started
+                    return self.stop_import(context, "Could not read %s (%s)" % (self._filenames[self._files_done], e))
+                if item is None:  # Every file is done
+                    self.finish(context)
+                    self.end_import(self._files_done)
+                    self._result = {'FINISHED'}
+                    return self._result
+                if isinstance(item, Exception):
+                    return self.stop_import(context, "Could not read %s (%s)" % (self._filenames[self._files_done], item))
+                self._steps = self.begin_file(*item)
+                self._step = (0, 1)
+                if self._steps is None: self._files_done += 1
+                continue
+            try:
+                self._built = True
+                self._step = next(self._steps)
+            except StopIteration as e:
+                self.end_file(e.value)
+                self._steps = None
+                self._files_done += 1
+            except Exception as e:  # A streamed Shape could not be parsed, or building failed
+                return self.stop_import(context, "Could not import %s (%s)" % (self._filenames[self._files_done], e))
+
+        step, step_count = self._step if self._steps is not None else (0, 1)
+        context.window_manager.progress_update(self._files_done + step / max(step_count, 1))
+        context.workspace.status_text_set("Importing %s (file %d of %d), %d%%. Press ESC to stop." %
+                                          (os.path.basename(self._filenames[min(self._files_done, len(self._filenames) - 1)]),
+                                           self._files_done + 1, len(self._filenames), 100 * step // max(step_count, 1)))
+        return {'RUNNING_MODAL'}
 
+    def next_file(self) -> Tuple[str, PreBlender_Scene, float, bool]:
+        """The next parsed file, or None when every file is done. Raises queue.Empty while it is still being parsed."""
+        if self._files is not None: return next(self._files, None)
+        return self._results.get_nowait()
+
+    def cancel(self, context):
+        self.stop_import(context)
+
+    def stop_import(self, context, error: str = None) -> set:
+        """Ends the import before every file is built (ESC, an error, undo or loading a file). What was completely built stays.
+        Returns what 'modal' returns: FINISHED if anything was built, so that it gets its own undo step."""
+        if self._result is not None: return self._result
+        self._stop.set()
+        if self._steps is not None:
+            self._steps.close()  # Stops before the next object
+            self._steps = None
+            self.remove_partial_file()
+        self.finish(context)
+        print("    Stopped, %d of %d file(s) were completely built" % (self._files_done, len(self._filenames)))
+        self.end_import(self._files_done)
+        if error is not None: self.report({'ERROR'}, error)
+        self._result = {'FINISHED'} if self._built else {'CANCELLED'}
+        return self._result
+
+    def finish(self, context):
+        for handlers in (bpy.app.handlers.undo_pre, bpy.app.handlers.redo_pre, bpy.app.handlers.load_pre):
+            if self._stop_before_undo in handlers: handlers.remove(self._stop_before_undo)
+        context.window_manager.event_timer_remove(self._timer)
+        context.window_manager.progress_end()
+        if context.workspace is not None: context.workspace.status_text_set(None)
+
+
+def parse_in_background(files: Iterator[Tuple[str, PreBlender_Scene, float, bool]], results: queue.Queue, stop: threading.Event):
+    """Thread body of the modal import. Puts every parsed file into 'results', then None.
+    An exception is put into 'results' instead of the remaining files."""
+    try:
+        for item in files:
+            if stop.is_set(): break
+            results.put(item)
+    except Exception as e:
+        results.put(e)
+    finally:
+        files.close()  # Shuts the process pool down
+        results.put(None)
+
+
+def read_wrl_files(directory: str, filenames: List[str], legacy_parser: bool = False, use_cache: bool = True,
+                   rebuild_cache: bool = False) -> Iterator[Tuple[str, PreBlender_Scene, float, bool]]:
+    """Parses several files at once in a process pool (parsing does not need Blender).
+    Yields (filename, scene, parse seconds, loaded from cache) in the given order as soon as each one is ready, so Blender can build the
+    first file while the others are still being parsed. Falls back to parsing one by one if the pool is unavailable."""
+    executor: concurrent.futures.ProcessPoolExecutor = None
+    futures: List[concurrent.futures.Future] = None
+    if len(filenames) > 1:
+        try:
+            context = multiprocessing.get_context("spawn")
+            # Blender 2.91 has 'sys.executable' set to Blender itself. Newer versions point it at their Python.
+            context.set_executable(getattr(bpy.app, "binary_path_python", None) or sys.executable)
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(len(filenames), os.cpu_count() or 1), mp_context=context)
+            futures = [executor.submit(read_wrl_file_cached, directory, filename, legacy_parser, use_cache, rebuild_cache) for filename in filenames]
+        except (OSError, ValueError, RuntimeError) as e:
+            print("    Parsing one file at a time, the process pool is not available (%s)" % e)
+            futures = None
+    try:
+        for i, filename in enumerate(filenames):
+            result: Tuple[PreBlender_Scene, float, bool] = None
+            if futures is not None:
+                try:
+                    result = futures[i].result()
+                except concurrent.futures.BrokenExecutor as e:
+                    print("    Parsing one file at a time, the process pool stopped working (%s)" % e)
+                    futures = None
+            if result is None:
+                result = read_wrl_file_cached(directory, filename, legacy_parser, use_cache, rebuild_cache)
+            yield (filename,) + result
+    finally:
+        if executor is not None:
+            for future in futures or ():
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+def read_wrl_files_streamed(directory: str, filenames: List[str], depth: int = 16) -> Iterator[Tuple[str, WRL_Shape_Stream, float, bool]]:
+    """Streaming version of 'read_wrl_files': yields a started 'WRL_Shape_Stream' (None for an empty file) instead of
+    a parsed scene. The next stream only starts once the caller asks for it, so one file is in flight at a time."""
+    for filename in filenames:
+        if os.path.getsize(os.path.join(directory, filename)) == 0:
+            yield filename, None, 0.0, False
+            continue
+        yield filename, WRL_Shape_Stream(directory, filename, depth), 0.0, False
+
+
+def read_wrl_files_appended(directory: str, filenames: List[str], states: List[Tuple[int, str]]) -> Iterator[Tuple[str, PreBlender_Scene, float, bool]]:
+    """Append mode version of 'read_wrl_files'. Every scene only holds the Shapes that were added since the file was
+    last imported in append mode; 'states' holds the 'append_state' of every file. Parsing a few new Shapes is quick,
+    so this does not use the process pool or the cache. Does not touch bpy, so it can run on another thread."""
+    for filename, (offset, head_hash) in zip(filenames, states):
+        time_start = time.perf_counter()
+        scene = read_wrl_file_appended(directory, filename, offset, head_hash)
+        yield filename, scene, time.perf_counter() - time_start, False
+
+
+# Custom properties on the Collection of an append mode import. The offset is a string because ID properties only hold 32 bit integers.
+APPEND_SOURCE_PROPERTY = "wrl_source"
+APPEND_OFFSET_PROPERTY = "wrl_offset"
+APPEND_SHAPE_COUNT_PROPERTY = "wrl_shape_count"
+APPEND_HEAD_HASH_PROPERTY = "wrl_head_hash"
+
+
+def find_append_collection(filepath: str) -> bpy.types.Collection:
+    """The Collection that new Shapes of this file are appended to, or None."""
+    source: str = os.path.normcase(os.path.abspath(filepath))
+    for C in bpy.data.collections:
+        if C.users > 0 and C.get(APPEND_SOURCE_PROPERTY) == source:
+            return C
+    return None
+
+
+def append_state(filepath: str) -> Tuple[int, str]:
+    """(byte offset, head hash) where the next append mode import of this file continues. (0, None) for the first one."""
+    blender_collection = find_append_collection(filepath)
+    if blender_collection is None: return 0, None
+    return int(blender_collection[APPEND_OFFSET_PROPERTY]), blender_collection[APPEND_HEAD_HASH_PROPERTY]
+
+
+def save_append_state(blender_collection: bpy.types.Collection, filepath: str, scene: PreBlender_Scene) -> int:
+    """Remembers where the next append mode import of this file continues. Returns the number of Shapes imported so far."""
+    shape_count: int = blender_collection.get(APPEND_SHAPE_COUNT_PROPERTY, 0) + len(scene.meshes)
+    blender_collection[APPEND_SOURCE_PROPERTY] = os.path.normcase(os.path.abspath(filepath))
+    blender_collection[APPEND_OFFSET_PROPERTY] = str(scene.end_offset)
+    blender_collection[APPEND_SHAPE_COUNT_PROPERTY] = shape_count
+    blender_collection[APPEND_HEAD_HASH_PROPERTY] = scene.head_hash
+    return shape_count
+
+
+def forget_append_state(blender_collection: bpy.types.Collection):
+    for name in (APPEND_SOURCE_PROPERTY, APPEND_OFFSET_PROPERTY, APPEND_SHAPE_COUNT_PROPERTY, APPEND_HEAD_HASH_PROPERTY):
+        if name in blender_collection: del blender_collection[name]
+
+
+def new_blender_mesh(arrays: mesh_arrays.Mesh_Arrays) -> bpy.types.Mesh:
+    """Builds a triangle mesh in bulk with 'foreach_set'."""
+    face_count: int = arrays.triangle_count
+    blender_mesh: bpy.types.Mesh = bpy.data.meshes.new(arrays.name)
+    blender_mesh.vertices.add(len(arrays.co))
+    blender_mesh.vertices.foreach_set("co", np.ascontiguousarray(arrays.co, dtype=np.float32).ravel())
+    blender_mesh.loops.add(len(arrays.loop_vertices))
+    blender_mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(arrays.loop_vertices, dtype=np.int32))
+    blender_mesh.polygons.add(face_count)
+    blender_mesh.polygons.foreach_set("loop_start", np.arange(0, face_count * 3, 3, dtype=np.int32))
+    if not bpy.types.MeshPolygon.bl_rna.properties['loop_total'].is_readonly:  # Derived from 'loop_start' in newer Blender versions
+        blender_mesh.polygons.foreach_set("loop_total", np.full(face_count, 3, dtype=np.int32))
+    # Same names the BMesh layers used to get by default
+    if arrays.loop_uvs is not None:
+        blender_mesh.uv_layers.new(name="UVMap").data.foreach_set("uv", np.ascontiguousarray(arrays.loop_uvs, dtype=np.float32).ravel())
+    if arrays.loop_colors is not None:
+        blender_mesh.vertex_colors.new(name="Col").data.foreach_set("color", np.ascontiguousarray(arrays.loop_colors, dtype=np.float32).ravel())
+    for name, values in arrays.face_attributes.items():
+        if hasattr(blender_mesh, "attributes"):
+            layer = blender_mesh.attributes.new(name=name, type='INT', domain='FACE')
+        else:  # Blender 2.91 has no generic mesh attributes yet
+            layer = blender_mesh.polygon_layers_int.new(name=name)
+        layer.data.foreach_set("value", np.ascontiguousarray(values, dtype=np.int32))
+    blender_mesh.update(calc_edges=True)
+    return blender_mesh
+
+
+class Blender_Material_Index:
+    """Materials that can be reused, looked up by the content hashes of their texture files or the filepath of their diffuse image.
+    Built once per import instead of scanning 'bpy.data.materials' for every material.
+    Materials created during the import must be added too so that they can be reused right away."""
+    HASH_PROPERTY = "wrl_texture_hash"  # 'texture_key' of the diffuse and alpha map files
 
-class PreBlender_Mesh:
     def __init__(self) -> None:
         super().__init__()
-        self.name = None
-        self.points: List[(float, float, float)] = []
-        self.texcoords: List[(float, float)] = []
-        self.colors: List[(float, float, float)] = []
-        self.material: PreBlender_Material = None
-
-    def __str__(self):
-        return self.name
+        self.by_texture_hash: Dict[str, bpy.types.Material] = {}
+        self.by_image_filepath: Dict[str, bpy.types.Material] = {}
+        self.vertex_color_only: bpy.types.Material = None
+        for M in bpy.data.materials:
+            self.add(M)
+
+    def add(self, M: bpy.types.Material):
+        if M.node_tree is None: return  # Not using nodes
+        if Blender_Material_Templates.TEMPLATE_PROPERTY in M: return  # Left behind by an import that failed
+        if Blender_Material_Index.HASH_PROPERTY in M:
+            self.by_texture_hash.setdefault(M[Blender_Material_Index.HASH_PROPERTY], M)
+        nodes: bpy.types.Nodes = M.node_tree.nodes
+        N = nodes.get('Diffuse Color')
+        if N is not None and getattr(N, 'image', None) is not None:
+            self.by_image_filepath.setdefault(N.image.filepath, M)  # First one wins, same as the old scan
+        if self.vertex_color_only is None and nodes.get('Vertex Color OnlyWRL') is not None:
+            self.vertex_color_only = M
+
+    @staticmethod
+    def texture_key(hash_diffuse: str, hash_alpha_map: str) -> str:
+        """Same texels but a different alpha map is a different material. None without a diffuse hash."""
+        if hash_diffuse is None: return None
+        return "%s/%s" % (hash_diffuse, hash_alpha_map)
+
+
+class Blender_Image_Index:
+    """Images looked up by the content hash of their file, so the same texels dumped under different filenames are
+    only loaded once. The hash is stored as a custom property on the image."""
+    HASH_PROPERTY = "wrl_texture_hash"
 
-
-class PreBlender_Scene:
     def __init__(self) -> None:
         super().__init__()
-        self.directory: str = ""
-        self.filename: str = ""
-        self.materials: List[PreBlender_Material] = []
-        self.meshes: List[PreBlender_Mesh] = []
-
-
-def read_wrl_file(directory: str = "C:\\VRML\\", filename: str = "output.wrl") -> PreBlender_Scene:
-    scene = PreBlender_Scene()
-    scene.directory = directory
-    scene.filename = filename
-    filepath: str = os.path.join(directory, filename)
-    if lilacdogoo_blender_import_wrl.debug: print(filepath)
-    # Begin Parsing File
-    f: TextIO = open(filepath, 'r', encoding='UTF-8')
-    content = f.readlines()
-    if len(content) == 0: return None
-    i: int = 0
-    while i < len(content):
-        s: List[str] = content[i].split()
-        if (len(s) > 0) and (s[0] == "Shape") and (s[1] == "{"):  # Shape
-            material = PreBlender_Material()
-            mesh = PreBlender_Mesh()
-            i += 1
-            s = content[i].split()
-            while not s[0] == "}":
-                if s[0] == "appearance":  # Material
-                    material.name = s[2]
-                    i += 1
-                    s = content[i].split()
-                    while not s[0] == "}":
-                        if s[0] == "material":  # Material Parameters
-                            i += 1
-                            s = content[i].split()
-                            while not s[0] == "}":
-                                if s[0] == "ambientIntensity": material.ambient_intensity = float(s[1])
-                                if s[0] == "diffuseColor": material.diffuse_color = [float(s[1]), float(s[2]), float(s[3])]
-                                if s[0] == "specularColor": material.specular_color = [float(s[1]), float(s[2]), float(s[3])]
-                                if s[0] == "emisiveColor": material.emisive_color = [float(s[1]), float(s[2]), float(s[3])]
-                                if s[0] == "shinines": material.specular = float(s[1])
-                                if s[0] == "transparency": material.alpha = 1 - float(s[1])
-                                i += 1
-                                s = content[i].split()
-                        elif s[0] == "texture":  # Texture Parameters
-                            i += 1
-                            s = content[i].split()
-                            while not s[0] == "}":
-                                if s[0] == "url": material.texture_url = s[1].strip("\"")
-                                if s[0] == "repeatS": material.texture_repeat = s[1] == "TRUE"
-                                i += 1
-                                s = content[i].split()
-                        i += 1
-                        s = content[i].split()
-                elif s[0] == "geometry":  # Mesh
-                    mesh.name = s[2]
-                    i += 1
-                    s = content[i].split()
-                    while not s[0] == "}":
-                        if s[0] == "coord":  # Mesh Verticies
-                            i += 1
-                            s = content[i].split()
-                            while not s[0] == "}":
-                                if s[0] == "point":
-                                    i += 1
-                                    s = content[i].split()
-                                    while not s[0] == "]":
-                                        # Load Rotated so it is upright in Blender
-                                        mesh.points.append((float(s[0]), -float(s[2].strip(",")), float(s[1])))
-                                        i += 1
-                                        s = content[i].split()
-                                i += 1
-                                s = content[i].split()
-                        elif s[0] == "texCoord":  # Mesh Texture Coordinates
-                            i += 1
-                            s = content[i].split()
-                            while not s[0] == "}":
-                                if s[0] == "point":
-                                    i += 1
-                                    s = content[i].split()
-                                    while not s[0] == "]":
-                                        mesh.texcoords.append((float(s[0]), float(s[1].strip(","))))
-                                        i += 1
-                                        s = content[i].split()
-                                i += 1
-                                s = content[i].split()
-                        elif s[0] == "color":  # Vertex Colors
-                            i += 1
-                            s = content[i].split()
-                            while not s[0] == "}":
-                                if s[0] == "color":
-                                    i += 1
-                                    s = content[i].split()
-                                    while not s[0] == "]":
-                                        mesh.colors.append((float(s[0]), float(s[1]), float(s[2].strip(","))))
-                                        i += 1
-                                        s = content[i].split()
-                                i += 1
-                                s = content[i].split()
-                        i += 1
-                        s = content[i].split()
-                i += 1
-                s = content[i].split()
-
-            # Search for Duplicate Material
-            _mat_dupe_: bool = False
-            for _mat_ in scene.materials:
-                if preBlender_Material_equals(material, _mat_):
-                    material = _mat_  # use the duplicate instead
-                    _mat_dupe_ = True
-                    break
-            # if no duplicate found then append
-            if not _mat_dupe_:
-                material.index = len(scene.materials)
-                scene.materials.append(material)
-            # Assign Material to Mesh
-            mesh.material = material
-            # Link mesh to material IF none already - For usage with some shader defaults.
-            if mesh.material.first_mesh_linked is None:
-                mesh.material.first_mesh_linked = mesh
-
-            scene.meshes.append(mesh)
-        i += 1
-    f.close()
-    return scene
-
-
-# Pretty hack but should work reliably.
-# Skip the header then check if every single byte after is zero.
-def is_BMP_valid_transparency(path: str) -> bool:
-    f: BinaryIO = open(os.path.join(path), 'rb')
-    f.seek(0x36)
-    b = f.read(1)
-    while len(b) > 0:
-        if b[0] > 0: return True  # A byte was not zero, transparency will be activated
-        b = f.read(1)
-    return False
-
-
-def to_blender(scene: PreBlender_Scene, p_reuse_materials: bool, p_cull_back_facing: bool):
-    if scene is None: return
-    r = random.Random()
+        self.by_hash: Dict[str, bpy.types.Image] = {}
+        self.shared: int = 0  # Loads that were answered with an image of another filename
+        for I in bpy.data.images:
+            if Blender_Image_Index.HASH_PROPERTY in I:
+                self.by_hash.setdefault(I[Blender_Image_Index.HASH_PROPERTY], I)
+
+    def load(self, path: str, content_hash: str = None) -> bpy.types.Image:
+        """Without a 'content_hash' only the exact same path is shared, like before."""
+        if content_hash is not None:
+            I = self.by_hash.get(content_hash)
+            if I is not None:
+                if I.filepath != path: self.shared += 1
+                return I
+        I = bpy.data.images.load(filepath=path, check_existing=True)
+        if content_hash is not None:
+            I[Blender_Image_Index.HASH_PROPERTY] = content_hash
+            self.by_hash[content_hash] = I
+        return I
+
+
+class Blender_Mesh_Index:
+    """Meshes from earlier imports, looked up by 'mesh_arrays.content_hash'. The hash is stored as a custom property
+    on the mesh data so the index survives saving and reloading the .blend file.
+    Meshes without users are left out; they belong to objects the user deleted on purpose."""
+    HASH_PROPERTY = "wrl_content_hash"
 
-    # ▬▬ MATERIALS ▬▬
-    blenderMaterials: List[bpy.types.Material] = []
-    reusable_vertex_color_only_material: bpy.types.Material = None
-
-    for mat in scene.materials:
-        # Usage Flags
-        path_diffuse: str = os.path.join(scene.directory, mat.texture_url) if mat.texture_url is not None else None
-        if path_diffuse is None or not os.path.isfile(path_diffuse): path_diffuse = None
-        use_vertex_color: bool = True if mat.first_mesh_linked is not None and len(mat.first_mesh_linked.colors) > 0 else False
-
-        # Check if this texture is already in the project
-        if p_reuse_materials:
-            if path_diffuse is not None:
-                found_existing_material: bool = False
-                for M in bpy.data.materials:
-                    if M.node_tree.nodes.find('Diffuse Color') != -1:
-                        N = M.node_tree.nodes['Diffuse Color']
-                        if N.image is not None and N.image.filepath == path_diffuse:
-                            blenderMaterials.append(M)
-                            found_existing_material = True
-                            break
-                if found_existing_material: continue
-            elif use_vertex_color:
-                if reusable_vertex_color_only_material is not None:
-                    blenderMaterials.append(reusable_vertex_color_only_material)
-                    continue
-                found_existing_material: bool = False
-                for M in bpy.data.materials:
-                    if M.node_tree.nodes.find('Vertex Color OnlyWRL') != -1:
-                        reusable_vertex_color_only_material = M
-                        blenderMaterials.append(M)
-                        found_existing_material = True
-                        break
-                if found_existing_material: continue
-
-        path_alpha_map: str = None  # Another Usage Flag (Variable MUST be defined past this point)
-        if path_diffuse is not None:
-            path_alpha_map = os.path.join(scene.directory, mat.texture_url.replace("_c.", "_a."))
-            if not os.path.isfile(path_alpha_map) or not is_BMP_valid_transparency(path_alpha_map):
-                path_alpha_map = None
-        use_ambient_intensity = True if mat.ambient_intensity is not None and mat.ambient_intensity != 1 else False
-
-        # Create Blender Material
-        blenderMaterial: bpy.types.Material = bpy.data.materials.new(mat.name)
-        blenderMaterial.diffuse_color = (r.random(), r.random(), r.random(), 1.0)
-        blenderMaterial.use_backface_culling = p_cull_back_facing
-        blenderMaterial.use_nodes = True
-
-        # ▬ NODES ▬
-        # Principled BSDF
-        nodes: bpy.types.Nodes = blenderMaterial.node_tree.nodes
-        node_bsdf: bpy.types.Node = nodes['Principled BSDF']
-        node_bsdf.inputs['Base Color'].default_value = mat.diffuse_color[0], mat.diffuse_color[1], mat.diffuse_color[2], 1.0
-        # TODO Specular color is unused - I will implement it if I find a need to
-        node_bsdf.inputs['Specular'].default_value = 0.0
-        node_bsdf.inputs['Emission'].default_value = mat.emissive_color[0], mat.emissive_color[1], mat.emissive_color[2], 1.0
-        node_bsdf.inputs['Alpha'].default_value = mat.alpha
-
-        # Vector Math - Ambient intensity
+    def __init__(self) -> None:
+        super().__init__()
+        self.by_hash: Dict[str, bpy.types.Mesh] = {}
+        for M in bpy.data.meshes:
+            if M.users > 0 and Blender_Mesh_Index.HASH_PROPERTY in M:
+                self.by_hash.setdefault(M[Blender_Mesh_Index.HASH_PROPERTY], M)
+
+    def add(self, M: bpy.types.Mesh, content_hash: str):
+        M[Blender_Mesh_Index.HASH_PROPERTY] = content_hash
+        self.by_hash.setdefault(content_hash, M)
+
+
+def build_material_nodes(blenderMaterial: bpy.types.Material, use_diffuse: bool, use_vertex_color: bool, use_ambient_intensity: bool, use_alpha_map: bool):
+    """Creates and links the shader nodes of one topology. Values that differ per material (colors, images,
+    intensity) are left at their defaults for the caller to set."""
+    blenderMaterial.use_nodes = True
+
+    # ▬ NODES ▬
+    # Principled BSDF
+    nodes: bpy.types.Nodes = blenderMaterial.node_tree.nodes
+    node_bsdf: bpy.types.Node = nodes['Principled BSDF']
+    # TODO Specular color is unused - I will implement it if I find a need to
+    node_bsdf.inputs['Specular'].default_value = 0.0
+
+    # Vector Math - Ambient intensity
+    if use_ambient_intensity:
+        node_ambient_intensity: bpy.types.Node = nodes.new('ShaderNodeVectorMath')
+        node_ambient_intensity.name = "Ambient Intensity"
+        node_ambient_intensity.label = "Ambient Intensity"
+        node_ambient_intensity.location = (node_bsdf.location[0] - node_ambient_intensity.width - 50, node_bsdf.location[1])
+        node_ambient_intensity.operation = 'SCALE'
+
+    # RGB Multiply - Vertex Color
+    if use_vertex_color and use_diffuse:
+        node_mix_vertex_color: bpy.types.Node = nodes.new('ShaderNodeMixRGB')
+        node_mix_vertex_color.name = "Mix Col & VertCol"
+        node_mix_vertex_color.label = "Mix Col & VertCol"
+        node_mix_vertex_color.blend_type = 'MULTIPLY'
+        node_mix_vertex_color.inputs['Fac'].default_value = 1.0
+        node_mix_vertex_color.inputs['Color1'].default_value = (1.0, 1.0, 1.0, 1.0)
+        node_mix_vertex_color.inputs['Color2'].default_value = (1.0, 1.0, 1.0, 1.0)
         if use_ambient_intensity:
-            node_ambient_intensity: bpy.types.Node = nodes.new('ShaderNodeVectorMath')
-            node_ambient_intensity.name = "Ambient Intensity"
-            node_ambient_intensity.label = "Ambient Intensity"
-            node_ambient_intensity.location = (node_bsdf.location[0] - node_ambient_intensity.width - 50, node_bsdf.location[1])
-            node_ambient_intensity.operation = 'SCALE'
-            node_ambient_intensity.inputs['Scale'].default_value = mat.ambient_intensity
-
-        # RGB Multiply - Vertex Color
-        if use_vertex_color and path_diffuse is not None:
-            node_mix_vertex_color: bpy.types.Node = nodes.new('ShaderNodeMixRGB')
-            node_mix_vertex_color.name = "Mix Col & VertCol"
-            node_mix_vertex_color.label = "Mix Col & VertCol"
-            node_mix_vertex_color.blend_type = 'MULTIPLY'
-            node_mix_vertex_color.inputs['Fac'].default_value = 1.0
-            node_mix_vertex_color.inputs['Color1'].default_value = (1.0, 1.0, 1.0, 1.0)
-            node_mix_vertex_color.inputs['Color2'].default_value = (1.0, 1.0, 1.0, 1.0)
+            node_mix_vertex_color.location = (node_ambient_intensity.location[0] - node_mix_vertex_color.width - 50, node_bsdf.location[1])
+        else:
+            node_mix_vertex_color.location = (node_bsdf.location[0] - node_mix_vertex_color.width - 50, node_bsdf.location[1])
+
+    # Texture Node
+    if use_diffuse:
+        node_texture_diffuse: bpy.types.Node = nodes.new('ShaderNodeTexImage')
+        node_texture_diffuse.name = "Diffuse Color"
+        node_texture_diffuse.label = "Diffuse Color"
+        node_texture_diffuse.width = 300
+        if use_vertex_color:
+            node_texture_diffuse.location = (node_mix_vertex_color.location[0] - node_texture_diffuse.width - 50, node_bsdf.location[1])
+        else:
             if use_ambient_intensity:
-                node_mix_vertex_color.location = (node_ambient_intensity.location[0] - node_mix_vertex_color.width - 50, node_bsdf.location[1])
+                node_texture_diffuse.location = (node_ambient_intensity.location[0] - node_texture_diffuse.width - 50, node_bsdf.location[1])
             else:
-                node_mix_vertex_color.location = (node_bsdf.location[0] - node_mix_vertex_color.width - 50, node_bsdf.location[1])
-
-        # Texture Node
-        if path_diffuse is not None:
-            node_texture_diffuse: bpy.types.Node = nodes.new('ShaderNodeTexImage')
-            node_texture_diffuse.name = "Diffuse Color"
-            node_texture_diffuse.label = "Diffuse Color"
-            node_texture_diffuse.width = 300
-            F = os.path.join(scene.directory, mat.texture_url)  # Filepath of image to add to blender
-            if os.path.isfile(F):
-                node_texture_diffuse.image = bpy.data.images.load(filepath=F, check_existing=True)
-            node_texture_diffuse.extension = 'REPEAT' if mat.texture_repeat else 'CLIP'
-            if use_vertex_color:
-                node_texture_diffuse.location = (node_mix_vertex_color.location[0] - node_texture_diffuse.width - 50, node_bsdf.location[1])
-            else:
-                if use_ambient_intensity:
-                    node_texture_diffuse.location = (node_ambient_intensity.location[0] - node_texture_diffuse.width - 50, node_bsdf.location[1])
-                else:
-                    node_texture_diffuse.location = (node_bsdf.location[0] - node_texture_diffuse.width - 50, node_bsdf.location[1])
-
-        # Vertex Color Node
-        if use_vertex_color:
-            node_vertex_color: bpy.types.Node = nodes.new('ShaderNodeVertexColor')
+                node_texture_diffuse.location = (node_bsdf.location[0] - node_texture_diffuse.width - 50, node_bsdf.location[1])
+
+    # Vertex Color Node
+    if use_vertex_color:
+        node_vertex_color: bpy.types.Node = nodes.new('ShaderNodeVertexColor')
+        node_vertex_color.name = "Vertex Color"
+        node_vertex_color.label = "Vertex Color"
+        if use_diffuse:
             node_vertex_color.name = "Vertex Color"
-            node_vertex_color.label = "Vertex Color"
-            if path_diffuse is not None:
+            node_vertex_color.location = (node_mix_vertex_color.location[0] - node_vertex_color.width - 50, node_texture_diffuse.location[1] - 300)
+        else:
+            if use_ambient_intensity:
                 node_vertex_color.name = "Vertex Color"
-                node_vertex_color.location = (node_mix_vertex_color.location[0] - node_vertex_color.width - 50, node_texture_diffuse.location[1] - 300)
+                node_vertex_color.location = (node_ambient_intensity.location[0] - node_vertex_color.width - 50, node_ambient_intensity.location[1] - 30)
             else:
-                if use_ambient_intensity:
-                    node_vertex_color.name = "Vertex Color"
-                    node_vertex_color.location = (node_ambient_intensity.location[0] - node_vertex_color.width - 50, node_ambient_intensity.location[1] - 30)
-                else:
-                    node_vertex_color.name = "Vertex Color OnlyWRL"  # The name of this node is used to locate it again in order to reuse this material later
-                    node_vertex_color.location = (node_bsdf.location[0] - node_vertex_color.width - 50, node_bsdf.location[1] - 30)
-
-        if path_alpha_map is not None:
-            # Texture Aplha Inversion Node
-            node_texture_alpha_inversion: bpy.types.Node = nodes.new('ShaderNodeMath')
-            node_texture_alpha_inversion.name = "Invert Alpha"
-            node_texture_alpha_inversion.label = "Invert Alpha"
-            node_texture_alpha_inversion.operation = 'SUBTRACT'
-            node_texture_alpha_inversion.inputs[0].default_value = 1.0
-            node_texture_alpha_inversion.inputs[1].default_value = 0.0
-            node_texture_alpha_inversion.location = node_bsdf.location[0] - node_texture_alpha_inversion.width - 50, node_bsdf.location[1] - 540
-
-            # Texture Alpha Node
-            node_texture_alpha: bpy.types.Node = nodes.new('ShaderNodeTexImage')
-            node_texture_alpha.name = "Alpha Map"
-            node_texture_alpha.label = "Alpha Map"
-            node_texture_alpha.width = 300
-            node_texture_alpha.image = bpy.data.images.load(filepath=path_alpha_map, check_existing=True)
-            node_texture_alpha.location = node_texture_alpha_inversion.location[0] - node_texture_alpha.width - 50, node_bsdf.location[1] - 480
-
-        # ▬ NODE LINKS ▬
-        links: bpy.types.NodeLinks = blenderMaterial.node_tree.links
-        if use_ambient_intensity:
-            links.new(node_ambient_intensity.outputs['Vector'], node_bsdf.inputs['Base Color'])
-            if path_diffuse is not None:
-                if use_vertex_color:
-                    links.new(node_mix_vertex_color.outputs['Color'], node_ambient_intensity.inputs['Vector'])
-                    links.new(node_texture_diffuse.outputs['Color'], node_mix_vertex_color.inputs['Color1'])
-                    links.new(node_vertex_color.outputs['Color'], node_mix_vertex_color.inputs['Color2'])
-                else:
-                    links.new(node_texture_diffuse.outputs['Color'], node_ambient_intensity.inputs['Vector'])
+                node_vertex_color.name = "Vertex Color OnlyWRL"  # The name of this node is used to locate it again in order to reuse this material later
+                node_vertex_color.location = (node_bsdf.location[0] - node_vertex_color.width - 50, node_bsdf.location[1] - 30)
+
+    if use_alpha_map:
+        # Texture Aplha Inversion Node
+        node_texture_alpha_inversion: bpy.types.Node = nodes.new('ShaderNodeMath')
+        node_texture_alpha_inversion.name = "Invert Alpha"
+        node_texture_alpha_inversion.label = "Invert Alpha"
+        node_texture_alpha_inversion.operation = 'SUBTRACT'
+        node_texture_alpha_inversion.inputs[0].default_value = 1.0
+        node_texture_alpha_inversion.inputs[1].default_value = 0.0
+        node_texture_alpha_inversion.location = node_bsdf.location[0] - node_texture_alpha_inversion.width - 50, node_bsdf.location[1] - 540
+
+        # Texture Alpha Node
+        node_texture_alpha: bpy.types.Node = nodes.new('ShaderNodeTexImage')
+        node_texture_alpha.name = "Alpha Map"
+        node_texture_alpha.label = "Alpha Map"
+        node_texture_alpha.width = 300
+        node_texture_alpha.location = node_texture_alpha_inversion.location[0] - node_texture_alpha.width - 50, node_bsdf.location[1] - 480
+
+    # ▬ NODE LINKS ▬
+    links: bpy.types.NodeLinks = blenderMaterial.node_tree.links
+    if use_ambient_intensity:
+        links.new(node_ambient_intensity.outputs['Vector'], node_bsdf.inputs['Base Color'])
+        if use_diffuse:
+            if use_vertex_color:
+                links.new(node_mix_vertex_color.outputs['Color'], node_ambient_intensity.inputs['Vector'])
+                links.new(node_texture_diffuse.outputs['Color'], node_mix_vertex_color.inputs['Color1'])
+                links.new(node_vertex_color.outputs['Color'], node_mix_vertex_color.inputs['Color2'])
             else:
-                if use_vertex_color:
-                    links.new(node_vertex_color.outputs['Color'], node_ambient_intensity.inputs['Vector'])
+                links.new(node_texture_diffuse.outputs['Color'], node_ambient_intensity.inputs['Vector'])
         else:
-            if path_diffuse is not None:
-                if use_vertex_color:
-                    links.new(node_mix_vertex_color.outputs['Color'], node_bsdf.inputs['Base Color'])
-                    links.new(node_texture_diffuse.outputs['Color'], node_mix_vertex_color.inputs['Color1'])
-                    links.new(node_vertex_color.outputs['Color'], node_mix_vertex_color.inputs['Color2'])
-                else:
-                    links.new(node_texture_diffuse.outputs['Color'], node_bsdf.inputs['Base Color'])
+            if use_vertex_color:
+                links.new(node_vertex_color.outputs['Color'], node_ambient_intensity.inputs['Vector'])
+    else:
+        if use_diffuse:
+            if use_vertex_color:
+                links.new(node_mix_vertex_color.outputs['Color'], node_bsdf.inputs['Base Color'])
+                links.new(node_texture_diffuse.outputs['Color'], node_mix_vertex_color.inputs['Color1'])
+                links.new(node_vertex_color.outputs['Color'], node_mix_vertex_color.inputs['Color2'])
             else:
-                if use_vertex_color:
-                    links.new(node_vertex_color.outputs['Color'], node_bsdf.inputs['Base Color'])
+                links.new(node_texture_diffuse.outputs['Color'], node_bsdf.inputs['Base Color'])
+        else:
+            if use_vertex_color:
+                links.new(node_vertex_color.outputs['Color'], node_bsdf.inputs['Base Color'])
+
+    if use_alpha_map:
+        links.new(node_texture_alpha.outputs['Color'], node_texture_alpha_inversion.inputs[1])
+        links.new(node_texture_alpha.outputs['Color'], node_bsdf.inputs['Alpha'])
+        blenderMaterial.blend_method = 'CLIP'
 
-        if path_alpha_map is not None:
-            links.new(node_texture_alpha.outputs['Color'], node_texture_alpha_inversion.inputs[1])
-            links.new(node_texture_alpha.outputs['Color'], node_bsdf.inputs['Alpha'])
-            blenderMaterial.blend_method = 'CLIP'
 
-        blenderMaterials.append(blenderMaterial)
+class Blender_Material_Templates:
+    """There are only a handful of node topologies (diffuse texture, vertex color, ambient intensity and alpha map
+    are each used or not). Each one is built once into a template material; every new material is a copy of it.
+    The templates are marked so the material index never reuses them, and must be removed after the import."""
+    TEMPLATE_PROPERTY = "wrl_template"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.templates: Dict[Tuple[bool, bool, bool, bool], bpy.types.Material] = {}
+
+    def new(self, name: str, use_diffuse: bool, use_vertex_color: bool, use_ambient_intensity: bool, use_alpha_map: bool) -> bpy.types.Material:
+        key = (use_diffuse, use_vertex_color, use_ambient_intensity, use_alpha_map)
+        T: bpy.types.Material = self.templates.get(key)
+        if T is None:
+            T = bpy.data.materials.new("WRL Template")
+            T[Blender_Material_Templates.TEMPLATE_PROPERTY] = True
+            build_material_nodes(T, *key)
+            self.templates[key] = T
+        M: bpy.types.Material = T.copy()
+        del M[Blender_Material_Templates.TEMPLATE_PROPERTY]
+        M.name = name
+        return M
+
+    def remove(self):
+        for T in self.templates.values():
+            bpy.data.materials.remove(T)
+        self.templates.clear()
+
+
+def triangle_index_from_blender(quantum: float) -> mesh_arrays.Triangle_Index:
+    """Every triangle of every mesh object in the 'WRL Import' Collections, in world space."""
+    index = mesh_arrays.Triangle_Index(quantum)
+    done = set()
+    for C in bpy.data.collections:
+        if not C.name.startswith("WRL Import"): continue
+        for O in C.all_objects:
+            if O.type != 'MESH' or O.name in done: continue
+            done.add(O.name)
+            M: bpy.types.Mesh = O.data
+            co = np.empty(len(M.vertices) * 3, dtype=np.float32)
+            M.vertices.foreach_get("co", co)
+            matrix = np.array(O.matrix_world, dtype=np.float32)
+            co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+            loop_vertices = np.empty(len(M.loops), dtype=np.int32)
+            M.loops.foreach_get("vertex_index", loop_vertices)
+            loop_start = np.empty(len(M.polygons), dtype=np.int32)
+            M.polygons.foreach_get("loop_start", loop_start)
+            loop_total = np.empty(len(M.polygons), dtype=np.int32)
+            M.polygons.foreach_get("loop_total", loop_total)
+            triangles = loop_start[loop_total == 3]  # Faces the user turned into something else are not compared
+            corners = loop_vertices[(triangles[:, None] + np.arange(3)).ravel()]
+            index.add(index.triangle_keys(co, corners))
+    return index
+
+
+def run_steps(steps: Iterator):
+    """Runs a step generator to the end and returns its return value."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+
+def to_blender(*args, **kwargs) -> bpy.types.Collection:
+    """Builds the whole scene in one go. Takes the same parameters as 'to_blender_steps'."""
+    return run_steps(to_blender_steps(*args, **kwargs))
+
+
+def new_blender_material(mat: PreBlender_Material, use_vertex_color: bool, texture_prepass: texture_files.Texture_Prepass,
+                         image_index: Blender_Image_Index, material_templates: Blender_Material_Templates, p_reuse_materials: bool,
+                         p_cull_back_facing: bool, material_index: Blender_Material_Index = None, stats: Import_Stats = None,
+                         r: random.Random = None) -> bpy.types.Material:
+    """The Blender material for 'mat': an existing one from 'material_index' (with 'p_reuse_materials') or a new one.
+    use_vertex_color: The first Shape with this material has vertex colors."""
+    if stats is None: stats = Import_Stats()
+    if r is None: r = random.Random()
+    # Usage Flags
+    path_diffuse, path_alpha_map = texture_prepass.get(mat.texture_url)  # Both are None if the file is missing
+    hash_diffuse, hash_alpha_map = texture_prepass.get_hashes(mat.texture_url)  # None unless the pre-pass hashed the files
+    texture_key: str = Blender_Material_Index.texture_key(hash_diffuse, hash_alpha_map)
+
+    # Check if this texture is already in the project
+    if p_reuse_materials:
+        if path_diffuse is not None:
+            M = material_index.by_texture_hash.get(texture_key) if texture_key is not None else None
+            if M is None: M = material_index.by_image_filepath.get(path_diffuse)
+            if M is not None:
+                stats.count("materials_reused")
+                return M
+        elif use_vertex_color:
+            if material_index.vertex_color_only is not None:
+                stats.count("materials_reused")
+                return material_index.vertex_color_only
+
+    use_ambient_intensity = True if mat.ambient_intensity is not None and mat.ambient_intensity != 1 else False
+
+    # Create Blender Material (a copy of the template with the same nodes)
+    blenderMaterial: bpy.types.Material = material_templates.new(mat.name, path_diffuse is not None, use_vertex_color, use_ambient_intensity, path_alpha_map is not None)
+    blenderMaterial.diffuse_color = (r.random(), r.random(), r.random(), 1.0)
+    blenderMaterial.use_backface_culling = p_cull_back_facing
+
+    # ▬ PARAMETERS ▬
+    nodes: bpy.types.Nodes = blenderMaterial.node_tree.nodes
+    node_bsdf: bpy.types.Node = nodes['Principled BSDF']
+    node_bsdf.inputs['Base Color'].default_value = mat.diffuse_color[0], mat.diffuse_color[1], mat.diffuse_color[2], 1.0
+    node_bsdf.inputs['Emission'].default_value = mat.emissive_color[0], mat.emissive_color[1], mat.emissive_color[2], 1.0
+    node_bsdf.inputs['Alpha'].default_value = mat.alpha
+    if use_ambient_intensity:
+        nodes['Ambient Intensity'].inputs['Scale'].default_value = mat.ambient_intensity
+    if path_diffuse is not None:
+        node_texture_diffuse: bpy.types.Node = nodes['Diffuse Color']
+        node_texture_diffuse.image = image_index.load(path_diffuse, hash_diffuse)
+        node_texture_diffuse.extension = 'REPEAT' if mat.texture_repeat else 'CLIP'
+    if path_alpha_map is not None:
+        nodes['Alpha Map'].image = image_index.load(path_alpha_map, hash_alpha_map)
+
+    if texture_key is not None: blenderMaterial[Blender_Material_Index.HASH_PROPERTY] = texture_key
+    if material_index is not None: material_index.add(blenderMaterial)
+    stats.count("materials_created")
+    return blenderMaterial
+
+
+def to_blender_steps(scene: PreBlender_Scene, p_reuse_materials: bool, p_cull_back_facing: bool, material_index: Blender_Material_Index = None,
+                     texture_cache: texture_files.Texture_File_Cache = None, p_weld_distance: float = None, p_duplicate_geometry: str = 'NEW',
+                     mesh_index: Blender_Mesh_Index = None, p_merge_by_material: bool = False, stats: Import_Stats = None,
+                     blender_collection: bpy.types.Collection = None, p_deduplicate_textures: bool = False,
+                     image_index: Blender_Image_Index = None, p_cull_distance: float = None,
+                     triangle_index: mesh_arrays.Triangle_Index = None,
+                     material_templates: Blender_Material_Templates = None, stream: WRL_Shape_Stream = None) -> Iterator[Tuple[int, int]]:
+    """Builds the scene one object at a time. A material is built together with the first object that uses it.
+    Yields (steps done, step count) before every object, so the caller can stop in between; everything built up to
+    then is complete and already in the Collection.
+    Returns (StopIteration.value) the Collection the objects were added to.
+
+    p_weld_distance: Weld the vertices of every mesh with this distance. None keeps one vertex per point.
+    p_duplicate_geometry: 'NEW', 'LINK' or 'SKIP'. What happens to Shapes that are already in 'mesh_index'.
+    p_merge_by_material: One object per material instead of one per Shape.
+    stats: Receives the timings and counters of every phase.
+    blender_collection: Add the objects to this Collection instead of a new one.
+    p_deduplicate_textures: Share images (and with 'p_reuse_materials' materials) between texture files with the same content.
+    p_cull_distance: Drop triangles that are already in 'triangle_index' (within this distance). None keeps every triangle.
+    material_templates: Shared node topologies. Without it they are built and removed within this call (if it is not stopped early).
+    stream: Build the Shapes of this stream while it is still parsing, instead of 'scene.meshes' ('scene' must be
+        'stream.scene'). Each Shape is let go as soon as its object is built. The steps are bytes of the file then.
+        Cannot be combined with 'p_merge_by_material'. The stream is closed when this returns or is stopped."""
+    if scene is None: return None
+    if stats is None: stats = Import_Stats()
+    r = random.Random()
+
+    # Every object gets built from a list of Shapes: one each, or all Shapes that share a material
+    if stream is not None:
+        object_shapes: Iterator[Tuple[str, List[PreBlender_Mesh]]] = ((mesh.name, [mesh]) for mesh in stream)
+    elif p_merge_by_material:
+        material_groups: Dict[int, List[PreBlender_Mesh]] = {}
+        for mesh in scene.meshes:
+            material_groups.setdefault(mesh.material.index, []).append(mesh)
+        object_shapes: List[Tuple[str, List[PreBlender_Mesh]]] = [(scene.materials[i].name, meshes) for i, meshes in material_groups.items()]
+    else:
+        object_shapes: List[Tuple[str, List[PreBlender_Mesh]]] = [(mesh.name, [mesh]) for mesh in scene.meshes]
+    step_count: int = stream.file_size if stream is not None else len(object_shapes)
+
+    # ▬▬ MATERIALS ▬▬
+    blenderMaterials: Dict[int, bpy.types.Material] = {}  # PreBlender_Material.index -> Material
+    if p_reuse_materials and material_index is None:
+        with stats.phase("index_blend_data"):
+            material_index = Blender_Material_Index()
+    if image_index is None:
+        with stats.phase("index_blend_data"):
+            image_index = Blender_Image_Index()
+    images_shared: int = image_index.shared
+    remove_templates: bool = material_templates is None
+    if remove_templates: material_templates = Blender_Material_Templates()
+
+    # ▬ TEXTURE FILES ▬ (All file checks and alpha scans happen here, in parallel. A stream adds its urls as they come.)
+    with stats.phase("texture_prepass"):
+        if texture_cache is None: texture_cache = texture_files.Texture_File_Cache(scene.directory)
+        files_scanned, bytes_scanned, files_hashed = texture_cache.files_scanned, texture_cache.bytes_scanned, texture_cache.files_hashed
+        texture_prepass = texture_files.Texture_Prepass(scene.directory, (mat.texture_url for mat in scene.materials) if stream is None else (),
+                                                        texture_cache, content_hashes=p_deduplicate_textures)
+        if stream is None: texture_cache.save()
 
     # ▬▬ MESHES ▬▬
-    blender_collection: bpy.types.Collection = bpy.data.collections.new("WRL Import.000")
-    for mesh in scene.meshes:
-        # CREATE BLENDER STUFF
-        blender_mesh: bpy.types.Mesh = bpy.data.meshes.new(mesh.name)
-        blender_object: bpy.types.Object = bpy.data.objects.new(mesh.name, blender_mesh)
-        blender_bMesh: bmesh.types.BMesh = bmesh.new()
-        blender_bMesh.from_mesh(blender_mesh)
-
-        # Add Data to Face Loops (UV, Color)
-        blender_bMesh_uvLayer = blender_bMesh.loops.layers.uv.new() if len(mesh.texcoords) > 1 else None
-        blender_bMesh_colorLayer = blender_bMesh.loops.layers.color.new() if len(mesh.colors) > 2 else None
-
-        # Create Vertices
-        blender_bMesh_verts = []  # Need to access this to create faces
-        for point in mesh.points:
-            blender_bMesh_verts.append(blender_bMesh.verts.new(point))
-        blender_bMesh.verts.index_update()
-
-        # Create Faces (All faces are triangles)
-        for i in range(0, len(mesh.points), 3):
-            # load faces backwards to correct normals direction
-            blender_face_loop = [blender_bMesh_verts[i + 2], blender_bMesh_verts[i + 1], blender_bMesh_verts[i]]  # Converts to Blender format
-            blender_bMesh_face: bmesh.types.BMFace = blender_bMesh.faces.new(blender_face_loop)
-            # Assign UV coords - Backwards to match how the face was created (to fix normals)
-            if blender_bMesh_uvLayer is not None:
-                blender_bMesh_face.loops[0][blender_bMesh_uvLayer].uv = mesh.texcoords[i + 2]
-                blender_bMesh_face.loops[1][blender_bMesh_uvLayer].uv = mesh.texcoords[i + 1]
-                blender_bMesh_face.loops[2][blender_bMesh_uvLayer].uv = mesh.texcoords[i]
-            # Assign Vertex Colors
-            if blender_bMesh_colorLayer is not None:
-                c = mesh.colors[i + 2]
-                blender_bMesh_face.loops[0][blender_bMesh_colorLayer] = c[0], c[1], c[2], 1.0
-                c = mesh.colors[i + 1]
-                blender_bMesh_face.loops[1][blender_bMesh_colorLayer] = c[0], c[1], c[2], 1.0
-                c = mesh.colors[i]
-                blender_bMesh_face.loops[2][blender_bMesh_colorLayer] = c[0], c[1], c[2], 1.0
-
-        # Push BMesh to Mesh
-        blender_bMesh.to_mesh(blender_mesh)
-        blender_bMesh.free()
-        # Set Object Properties
-        blender_mesh.materials.append(blenderMaterials[mesh.material.index])
-        blender_object.color = blenderMaterials[mesh.material.index].diffuse_color
-        # Add Object to New Collection
-        blender_collection.objects.link(blender_object)
-    # Add New Collection to Blender scene
-    bpy.context.scene.collection.children.link(blender_collection)
+    if blender_collection is None:
+        # Added to the scene right away, so that objects built before a stop are not left without a Collection
+        blender_collection = bpy.data.collections.new("WRL Import.000")
+        bpy.context.scene.collection.children.link(blender_collection)
+    vertex_count_before: int = 0
+    vertex_count_after: int = 0
+    collapsed_triangles: int = 0
+    if mesh_index is None:
+        with stats.phase("index_blend_data"):
+            mesh_index = Blender_Mesh_Index()
+    linked_shapes: int = 0
+    skipped_shapes: int = 0
+    culled_triangles: int = 0
+    culled_objects: int = 0
+    if p_cull_distance is not None and triangle_index is None:
+        with stats.phase("index_blend_data"):
+            triangle_index = triangle_index_from_blender(p_cull_distance)
+
+    try:
+        for step, (name, meshes) in enumerate(object_shapes):
+            yield (stream.bytes_parsed if stream is not None else step), step_count
+            stats.count("shapes", len(meshes))
+            stats.count("triangles", sum(len(mesh.points) // 3 for mesh in meshes))
+            # Geometry that already exists. The hash is always stored so that later imports can find this mesh.
+            with stats.phase("content_hash"):
+                content_hash: str = mesh_arrays.content_hash(meshes, extra="weld=%r merged=%r" % (p_weld_distance, p_merge_by_material))
+            blender_mesh: bpy.types.Mesh = None
+            if p_duplicate_geometry != 'NEW':
+                blender_mesh = mesh_index.by_hash.get(content_hash)
+                if blender_mesh is not None:
+                    if p_duplicate_geometry == 'SKIP':
+                        skipped_shapes += len(meshes)
+                        continue
+                    linked_shapes += len(meshes)
+            if blender_mesh is None:
+                with stats.phase("mesh_arrays"):
+                    if p_merge_by_material:
+                        arrays: mesh_arrays.Mesh_Arrays = mesh_arrays.merge(name, [mesh_arrays.from_preBlender_mesh(mesh) for mesh in meshes], "wrl_shape_index")
+                    else:
+                        arrays: mesh_arrays.Mesh_Arrays = mesh_arrays.from_preBlender_mesh(meshes[0])
+                culled: int = 0
+                if p_cull_distance is not None:
+                    with stats.phase("cull_duplicates"):
+                        culled = mesh_arrays.cull_duplicate_triangles(arrays, triangle_index)
+                    culled_triangles += culled
+                    if arrays.triangle_count == 0:
+                        culled_objects += 1
+                        continue
+                if p_weld_distance is not None:
+                    with stats.phase("weld"):
+                        vertex_count_before += len(arrays.co)
+                        collapsed_triangles += mesh_arrays.weld_vertices(arrays, p_weld_distance)
+                        vertex_count_after += len(arrays.co)
+                # The Material is only built for a new mesh. A linked mesh brings its own, a skipped or culled Shape needs none.
+                material_number: int = meshes[0].material.index
+                if material_number not in blenderMaterials:
+                    mat: PreBlender_Material = meshes[0].material
+                    if stream is not None:
+                        with stats.phase("texture_prepass"):
+                            texture_prepass.add((mat.texture_url,))
+                    with stats.phase("materials"):
+                        blenderMaterials[material_number] = new_blender_material(mat, len(meshes[0].colors) > 0, texture_prepass, image_index, material_templates,
+                                                                                 p_reuse_materials, p_cull_back_facing, material_index, stats, r)
+                with stats.phase("mesh_build"):
+                    blender_mesh = new_blender_mesh(arrays)
+                    if p_merge_by_material:
+                        blender_mesh["wrl_shape_names"] = [mesh.name for mesh in meshes]
+                    blender_mesh.materials.append(blenderMaterials[material_number])
+                    if culled == 0: mesh_index.add(blender_mesh, content_hash)  # A culled mesh depends on what was already in the scene
+                stats.count("meshes_created")
+            # CREATE BLENDER STUFF
+            with stats.phase("objects"):
+                blender_object: bpy.types.Object = bpy.data.objects.new(name, blender_mesh)
+                # Set Object Properties
+                if len(blender_mesh.materials) > 0 and blender_mesh.materials[0] is not None:
+                    blender_object.color = blender_mesh.materials[0].diffuse_color
+                # Add Object to New Collection
+                blender_collection.objects.link(blender_object)
+            stats.count("objects")
+    finally:
+        if stream is not None: stream.close()
+    if remove_templates: material_templates.remove()
+    if stream is not None: texture_cache.save()
+    stats.count("images_shared", image_index.shared - images_shared)
+    stats.count("textures_checked", len(texture_prepass.table))
+    stats.count("textures_missing", sum(1 for path_diffuse, _ in texture_prepass.table.values() if path_diffuse is None))
+    stats.count("alpha_files_scanned", texture_cache.files_scanned - files_scanned)
+    stats.count("alpha_bytes_read", texture_cache.bytes_scanned - bytes_scanned)
+    stats.count("textures_hashed", texture_cache.files_hashed - files_hashed)
+    for phase, seconds in texture_prepass.phases.items():  # Parts of 'texture_prepass', summed over its threads
+        stats.add_time(phase, seconds)
+    print("    Checked %d textures in %.4f seconds (%.4f seconds saved by checking in parallel)" % (len(texture_prepass.table), texture_prepass.time_elapsed, texture_prepass.time_saved))
+    stats.count("shapes_linked", linked_shapes)
+    stats.count("shapes_skipped", skipped_shapes)
+    stats.count("collapsed_triangles", collapsed_triangles)
+    stats.count("duplicate_triangles_culled", culled_triangles)
+    if p_weld_distance is not None:
+        print("    Welded %d vertices down to %d (%d collapsed triangles removed)" % (vertex_count_before, vertex_count_after, collapsed_triangles))
+    if p_duplicate_geometry != 'NEW':
+        print("    Duplicate geometry: %d Shapes linked to existing meshes, %d Shapes skipped" % (linked_shapes, skipped_shapes))
+    if p_cull_distance is not None:
+        print("    Culled %d duplicate triangles (%d objects were left empty and not created)" % (culled_triangles, culled_objects))
+    return blender_collection
 
 
 if __name__ == "__main__":
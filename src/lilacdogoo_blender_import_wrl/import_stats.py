@@ -0,0 +1,94 @@
+"""
+Author: LilacDogoo
+
+Timings, counters and peak memory of an import, so a slow import can be traced back to the phase that caused it.
+Collecting the timings and counters is always on (a few clock reads per Shape). Memory tracing and cProfile are
+expensive and only run while an import is being profiled. Nothing in here uses Blender.
+"""
+from typing import Dict, List
+
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+import tracemalloc
+
+
+class Import_Stats:
+    """'phases': seconds spent per phase, summed over every file. 'counters': how many of something were handled.
+    Parsing fills the stats of its own scene (it may run in a worker process) and the import merges them in."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.files: List[dict] = []  # One entry per imported file
+        self.peak_memory: int = 0  # Bytes, only measured while profiling
+        self.profiler: cProfile.Profile = None
+        self.traced_memory: bool = False
+        self.time_start: float = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - time_start)
+
+    def add_time(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other: 'Import_Stats'):
+        for name, seconds in other.phases.items(): self.add_time(name, seconds)
+        for name, n in other.counters.items(): self.count(name, n)
+
+    # ▬▬ PROFILING ▬▬
+    def start_profiling(self, use_cprofile: bool = True):
+        """Traces peak memory (tracemalloc also sees NumPy allocations) and optionally runs cProfile.
+        Only the calling process is traced. Parsing that runs in worker processes shows up in 'phases' only."""
+        self.traced_memory = not tracemalloc.is_tracing()  # Somebody else is already tracing, leave it alone
+        if self.traced_memory: tracemalloc.start()
+        if use_cprofile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profiling(self):
+        if self.profiler is not None: self.profiler.disable()
+        if self.traced_memory:
+            self.traced_memory = False
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    # ▬▬ OUTPUT ▬▬
+    def as_dict(self) -> dict:
+        return {
+            "total_seconds": time.perf_counter() - self.time_start,
+            "phases": dict(sorted(self.phases.items(), key=lambda item: -item[1])),
+            "counters": dict(sorted(self.counters.items())),
+            "peak_memory_mb": self.peak_memory / (1 << 20),
+            "files": self.files,
+        }
+
+    def save_json(self, filepath: str):
+        with open(filepath, 'w', encoding='UTF-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def save_profile(self, filepath: str):
+        """Writes the cProfile data. Open it with 'python -m pstats' or a viewer like snakeviz."""
+        if self.profiler is not None:
+            pstats.Stats(self.profiler).dump_stats(filepath)
+
+    def print_report(self):
+        report = self.as_dict()
+        print("    Phases (seconds, summed over every file):")
+        for name, seconds in report["phases"].items():
+            print("        %-24s %9.4f" % (name, seconds))
+        print("    Counters:")
+        for name, n in report["counters"].items():
+            print("        %-24s %9d" % (name, n))
+        if self.peak_memory: print("    Peak memory: %.1f MB" % report["peak_memory_mb"])
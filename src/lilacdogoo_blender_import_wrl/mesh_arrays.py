@@ -0,0 +1,244 @@
+"""
+Author: LilacDogoo
+
+Flat NumPy arrays that describe one Blender mesh, and the operations done on them before the mesh is built.
+Nothing in here uses Blender.
+"""
+from typing import Dict, List, Tuple
+
+import hashlib
+
+import numpy as np
+
+from lilacdogoo_blender_import_wrl.wrl_parser import PreBlender_Mesh, preBlender_Material_key
+
+
+class Mesh_Arrays:
+    """co: (V, 3) vertex positions. loop_vertices: (L,) vertex index of every face corner, 3 per triangle.
+    loop_uvs: (L, 2) or None. loop_colors: (L, 4) or None. A layer is only created when its array is given.
+    face_attributes: name -> (L / 3,) int32, one integer attribute per face."""
+
+    def __init__(self, name: str, co: np.ndarray, loop_vertices: np.ndarray, loop_uvs: np.ndarray = None, loop_colors: np.ndarray = None) -> None:
+        super().__init__()
+        self.name: str = name
+        self.co: np.ndarray = co
+        self.loop_vertices: np.ndarray = loop_vertices
+        self.loop_uvs: np.ndarray = loop_uvs
+        self.loop_colors: np.ndarray = loop_colors
+        self.face_attributes: Dict[str, np.ndarray] = {}
+
+    @property
+    def triangle_count(self) -> int:
+        return len(self.loop_vertices) // 3
+
+
+def from_preBlender_mesh(mesh: PreBlender_Mesh) -> Mesh_Arrays:
+    """Every 3 points are one triangle. Each point becomes its own vertex, just like the dump."""
+    point_count: int = len(mesh.points) - len(mesh.points) % 3
+    # load faces backwards to correct normals direction: (i + 2, i + 1, i)
+    loop_order: np.ndarray = np.arange(point_count, dtype=np.int32).reshape(-1, 3)[:, ::-1].ravel()
+    # UV coords and Vertex Colors are stored per face corner, so they are read backwards too
+    loop_uvs = mesh.texcoords[loop_order] if len(mesh.texcoords) > 1 else None
+    loop_colors = None
+    if len(mesh.colors) > 2:
+        loop_colors = np.ones((len(loop_order), 4), dtype=np.float32)
+        loop_colors[:, :3] = mesh.colors[loop_order]
+    return Mesh_Arrays(mesh.name, mesh.points[:point_count], loop_order, loop_uvs, loop_colors)
+
+
+def merge(name: str, parts: List[Mesh_Arrays], face_attribute: str = None) -> Mesh_Arrays:
+    """Concatenates meshes into one. If only some parts have UVs (colors) the others get 0, 0 (white).
+    With 'face_attribute' every face stores the index of the part it came from under that name."""
+    vertex_offsets = np.cumsum([0] + [len(P.co) for P in parts[:-1]])
+    co = np.concatenate([P.co for P in parts]).astype(np.float32, copy=False)
+    loop_vertices = np.concatenate([P.loop_vertices + offset for P, offset in zip(parts, vertex_offsets)]).astype(np.int32, copy=False)
+    loop_uvs = None
+    if any(P.loop_uvs is not None for P in parts):
+        loop_uvs = np.concatenate([P.loop_uvs if P.loop_uvs is not None else np.zeros((len(P.loop_vertices), 2), dtype=np.float32) for P in parts])
+    loop_colors = None
+    if any(P.loop_colors is not None for P in parts):
+        loop_colors = np.concatenate([P.loop_colors if P.loop_colors is not None else np.ones((len(P.loop_vertices), 4), dtype=np.float32) for P in parts])
+    merged = Mesh_Arrays(name, co, loop_vertices, loop_uvs, loop_colors)
+    if face_attribute is not None:
+        merged.face_attributes[face_attribute] = np.repeat(np.arange(len(parts), dtype=np.int32), [P.triangle_count for P in parts])
+    return merged
+
+
+def content_hash(meshes: List[PreBlender_Mesh], quantum: float = 1e-4, extra: str = "") -> str:
+    """Hash of what a mesh looks like: points, texcoords and colors rounded to 'quantum', plus the material key.
+    Several meshes give the hash of them merged together, in that order.
+    Names are left out because the same geometry gets a different name in every rip. 'extra' is for build settings
+    that change the resulting Blender mesh (e.g. the weld distance)."""
+    hasher = hashlib.blake2b(digest_size=16)
+    for mesh in meshes:
+        for array in (mesh.points, mesh.texcoords, mesh.colors):
+            hasher.update(np.array(array.shape, dtype=np.int64).tobytes())
+            hasher.update(np.round(array / quantum).astype(np.int64).tobytes())
+        hasher.update(repr(preBlender_Material_key(mesh.material)).encode('UTF-8'))
+    hasher.update(extra.encode('UTF-8'))
+    return hasher.hexdigest()
+
+
+def keep_triangles(arrays: Mesh_Arrays, keep: np.ndarray):
+    """Removes every triangle whose entry in 'keep' (one bool per triangle) is False, and the vertices only they used."""
+    loop_keep = np.repeat(keep, 3)
+    arrays.loop_vertices = arrays.loop_vertices[loop_keep]
+    if arrays.loop_uvs is not None: arrays.loop_uvs = arrays.loop_uvs[loop_keep]
+    if arrays.loop_colors is not None: arrays.loop_colors = arrays.loop_colors[loop_keep]
+    for name, values in arrays.face_attributes.items():
+        arrays.face_attributes[name] = values[keep]
+    used = np.zeros(len(arrays.co), dtype=bool)
+    used[arrays.loop_vertices] = True
+    if not used.all():
+        renumber = np.cumsum(used, dtype=np.int32) - 1
+        arrays.co = arrays.co[used]
+        arrays.loop_vertices = renumber[arrays.loop_vertices]
+
+
+# ▬▬ DUPLICATE TRIANGLES ▬▬
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_AXIS_MULTIPLIERS = np.array((0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9), dtype=np.uint64)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    # SplitMix64 finalizer. Unsigned integer arrays wrap around silently, which is what a hash wants.
+    x = (x ^ (x >> np.uint64(30))) * _MIX_1
+    x = (x ^ (x >> np.uint64(27))) * _MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+class Triangle_Index:
+    """64 bit keys of every triangle in the scene, for finding triangles that were already imported.
+    A key is made from the corner positions rounded to 'quantum'. The corners are rotated (not sorted) so the
+    smallest comes first: the same triangle gets the same key whichever corner it starts with, but its back face
+    (opposite winding) gets a different key and is kept.
+    Keys are stored in sorted levels that merge like a binary counter, so adding many small meshes stays cheap and
+    every lookup is a few 'searchsorted' calls."""
+
+    def __init__(self, quantum: float) -> None:
+        super().__init__()
+        self.quantum: float = quantum
+        self.levels: List[np.ndarray] = []  # Sorted unique uint64 arrays, each less than half the size of the one before
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def triangle_keys(self, co: np.ndarray, loop_vertices: np.ndarray) -> np.ndarray:
+        """(T,) uint64 key of every triangle. 'loop_vertices' holds 3 vertex indices per triangle."""
+        grid = np.round(np.asarray(co, dtype=np.float64) / self.quantum).astype(np.int64).view(np.uint64)
+        vertex_keys = _mix64((grid * _AXIS_MULTIPLIERS).sum(axis=1, dtype=np.uint64))
+        corners = vertex_keys[loop_vertices].reshape(-1, 3)
+        order = (np.argmin(corners, axis=1)[:, None] + np.arange(3)) % 3
+        corners = np.take_along_axis(corners, order, axis=1)
+        return _mix64(corners[:, 0] + _mix64(corners[:, 1] + _mix64(corners[:, 2])))
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for level in self.levels:
+            i = np.minimum(np.searchsorted(level, keys), len(level) - 1)
+            found |= level[i] == keys
+        return found
+
+    def add(self, keys: np.ndarray):
+        keys = np.unique(keys)
+        self._insert(keys[~self.contains(keys)])
+
+    def _insert(self, keys: np.ndarray):
+        """'keys' must be sorted, unique and not in the index yet."""
+        if len(keys) == 0: return
+        while len(self.levels) > 0 and len(self.levels[-1]) <= 2 * len(keys):
+            # Two sorted runs without common keys: a stable sort only has to merge them
+            keys = np.concatenate((self.levels.pop(), keys))
+            keys.sort(kind='stable')
+        self.levels.append(keys)
+
+
+def cull_duplicate_triangles(arrays: Mesh_Arrays, index: Triangle_Index) -> int:
+    """Removes triangles that are already in 'index' or appear twice in this mesh, then adds the rest to 'index'.
+    Returns how many were removed."""
+    if arrays.triangle_count == 0: return 0
+    keys = index.triangle_keys(arrays.co, arrays.loop_vertices)
+    keep = ~index.contains(keys)
+    new_keys, first = np.unique(keys, return_index=True)
+    first_occurrence = np.zeros(len(keys), dtype=bool)
+    first_occurrence[first] = True
+    keep &= first_occurrence
+    index._insert(new_keys[keep[first]])
+    removed = int(len(keep) - np.count_nonzero(keep))
+    if removed > 0: keep_triangles(arrays, keep)
+    return removed
+
+
+# ▬▬ WELDING ▬▬
+def weld_index(co: np.ndarray, distance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges every vertex into the first vertex (in the order of the dump) that lies within 'distance' of it and was
+    not merged itself, like Blender's 'Merge by Distance'. 0 only merges exactly equal positions.
+    Returns (index of the first vertex of every group, group of every vertex). Groups keep the order of first use."""
+    # Exactly equal positions first: the dump repeats every shared vertex, which leaves far fewer to compare by distance
+    keys = (co + np.float32(0.0)).view(np.int32)  # Bitwise equal positions. Adding 0 turns -0.0 into 0.0
+    keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # np.unique sorts by key. Renumber the groups by first use so the vertex order follows the dump.
+    order = np.argsort(first)
+    renumber = np.empty(len(order), dtype=np.int32)
+    renumber[order] = np.arange(len(order), dtype=np.int32)
+    first, group = first[order], renumber[inverse.ravel()]
+    if distance <= 0 or len(first) < 2: return first, group
+
+    target = _merge_targets(np.asarray(co[first], dtype=np.float64), distance)
+    if np.array_equal(target, np.arange(len(target))): return first, group
+    targets = np.flatnonzero(target == np.arange(len(target)))
+    renumber = np.empty(len(target), dtype=np.int32)
+    renumber[targets] = np.arange(len(targets), dtype=np.int32)
+    return first[targets], renumber[target][group]
+
+
+def _merge_targets(co: np.ndarray, distance: float) -> np.ndarray:
+    """(V,) index of the vertex every vertex merges into (itself when it stays). Pairs closer than 'distance' can only
+    lie in the same or neighbouring grid cells of (at least) that size."""
+    # Cells are numbered row by row so a neighbour is always the same number away. The cells grow when a huge mesh
+    # would not fit into 64 bit numbers, which only finds more pairs for the distance test to drop.
+    extent = float((co.max(axis=0) - co.min(axis=0)).max())
+    cells = np.floor((co - co.min(axis=0)) / max(distance, extent / (1 << 20))).astype(np.int64) + 1
+    span = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * span[1] + cells[:, 1]) * span[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pairs_a: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+    pairs_b: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+    # The cell itself and half of its 26 neighbours: the other half finds the same pairs from the opposite side
+    for x, y, z in list(np.ndindex(3, 3, 3))[13:]:
+        neighbour_keys = sorted_keys + ((x - 1) * span[1] + y - 1) * span[2] + z - 1  # Still sorted, which keeps the search fast
+        lo = np.searchsorted(sorted_keys, neighbour_keys)
+        found = np.flatnonzero(sorted_keys[np.minimum(lo, len(sorted_keys) - 1)] == neighbour_keys)  # Most cells are empty
+        if len(found) == 0: continue
+        lo = lo[found]
+        counts = np.searchsorted(sorted_keys, neighbour_keys[found], side='right') - lo
+        a = order[np.repeat(found, counts)]
+        b = order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        pairs_a.append(np.maximum(a, b))
+        pairs_b.append(np.minimum(a, b))
+    a, b = np.concatenate(pairs_a), np.concatenate(pairs_b)
+    close = (a != b) & (((co[a] - co[b]) ** 2).sum(axis=1) <= distance * distance)
+    a, b = a[close], b[close]
+    # Every vertex takes the earliest vertex near it that is still a target. Going in order, that vertex is final.
+    target = np.arange(len(co))
+    pairs = np.lexsort((b, a))
+    for i, j in zip(a[pairs].tolist(), b[pairs].tolist()):
+        if target[i] == i and target[j] == j: target[i] = j
+    return target
+
+
+def weld_vertices(arrays: Mesh_Arrays, distance: float) -> int:
+    """Merges coincident vertices. UVs and colors are per face corner, so they are untouched and the look does not change.
+    Triangles that collapse (two corners welded together) are removed. Returns how many were removed."""
+    if len(arrays.co) == 0: return 0
+    first, group = weld_index(arrays.co, distance)
+    arrays.co = arrays.co[first]
+    arrays.loop_vertices = group[arrays.loop_vertices]
+    corners = arrays.loop_vertices.reshape(-1, 3)
+    keep = (corners[:, 0] != corners[:, 1]) & (corners[:, 1] != corners[:, 2]) & (corners[:, 0] != corners[:, 2])
+    removed = int(len(keep) - np.count_nonzero(keep))
+    if removed > 0: keep_triangles(arrays, keep)
+    return removed
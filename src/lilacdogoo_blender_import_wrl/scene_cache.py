@@ -0,0 +1,165 @@
+"""
+Author: LilacDogoo
+
+Binary sidecar cache of parsed scenes. Importing the same dump again loads this instead of parsing the text.
+
+File layout:
+    8 bytes   Magic "WRLSCENE"
+    uint32    Format version
+    uint32    Header length in bytes
+    JSON      Header: cache key, material table and one entry per mesh (offsets into the data block)
+    padding   Up to a multiple of 16 bytes
+    float32[] Data block. Every point, texcoord and color buffer, one after the other.
+
+The data block is memory-mapped when loading, so the mesh arrays are views into the file (no per vertex work).
+Like the parser, nothing in here uses Blender.
+"""
+from typing import List, Tuple
+
+import os
+import json
+import mmap
+import time
+import struct
+import hashlib
+
+import numpy as np
+
+import lilacdogoo_blender_import_wrl
+from lilacdogoo_blender_import_wrl.wrl_parser import PreBlender_Material, PreBlender_Mesh, PreBlender_Scene, read_wrl_file, scene_add_shape
+
+CACHE_EXTENSION = ".wrlcache"
+_MAGIC = b"WRLSCENE"
+_VERSION = 1
+_PREFIX = struct.Struct("<8sII")
+_ALIGNMENT = 16
+
+
+def cache_path(filepath: str) -> str:
+    return filepath + CACHE_EXTENSION
+
+
+def file_key(filepath: str) -> dict:
+    """Size, modification time and content hash of a dump. The cache is only used when all three match."""
+    stat = os.stat(filepath)
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": hasher.hexdigest()}
+
+
+def save_scene_cache(scene: PreBlender_Scene, filepath: str, key: dict):
+    materials: List[dict] = []
+    for mat in scene.materials:
+        materials.append({
+            "name": mat.name,
+            "ambient_intensity": mat.ambient_intensity,
+            "diffuse_color": list(mat.diffuse_color),
+            "specular_color": list(mat.specular_color),
+            "emissive_color": list(mat.emissive_color),
+            "alpha": mat.alpha,
+            "texture_url": mat.texture_url,
+            "texture_repeat": mat.texture_repeat,
+        })
+    buffers: List[np.ndarray] = []
+    offset: int = 0  # In float32 values
+    meshes: List[dict] = []
+    for mesh in scene.meshes:
+        entry = {"name": mesh.name, "material": mesh.material.index}
+        for field in ("points", "texcoords", "colors"):
+            array: np.ndarray = getattr(mesh, field)
+            entry[field] = [offset, len(array)]
+            buffers.append(np.ascontiguousarray(array, dtype=np.float32).ravel())
+            offset += array.size
+        meshes.append(entry)
+
+    header = json.dumps({"key": key, "materials": materials, "meshes": meshes}).encode('UTF-8')
+    padding = -(_PREFIX.size + len(header)) % _ALIGNMENT
+    temp_filepath = filepath + ".tmp"
+    with open(temp_filepath, 'wb') as f:
+        f.write(_PREFIX.pack(_MAGIC, _VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        for buffer in buffers:
+            f.write(buffer.tobytes())
+    os.replace(temp_filepath, filepath)
+
+
+def load_scene_cache(filepath: str, key: dict) -> PreBlender_Scene:
+    """Returns None if there is no usable cache for this key."""
+    try:
+        with open(filepath, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # Stays valid after the file is closed
+    except (OSError, ValueError):
+        return None  # Missing (or empty) cache file
+    if len(data) < _PREFIX.size: return None
+    magic, version, header_length = _PREFIX.unpack_from(data, 0)
+    if magic != _MAGIC or version != _VERSION: return None
+    try:
+        header = json.loads(bytes(data[_PREFIX.size:_PREFIX.size + header_length]).decode('UTF-8'))
+    except ValueError:
+        return None
+    if header.get("key") != key: return None
+    data_start = _PREFIX.size + header_length
+    data_start += -data_start % _ALIGNMENT
+
+    scene = PreBlender_Scene()
+    materials: List[PreBlender_Material] = []
+    for entry in header["materials"]:
+        mat = PreBlender_Material()
+        mat.name = entry["name"]
+        mat.ambient_intensity = entry["ambient_intensity"]
+        mat.diffuse_color = entry["diffuse_color"]
+        mat.specular_color = entry["specular_color"]
+        mat.emissive_color = entry["emissive_color"]
+        mat.alpha = entry["alpha"]
+        mat.texture_url = entry["texture_url"]
+        mat.texture_repeat = entry["texture_repeat"]
+        materials.append(mat)
+
+    widths = {"points": 3, "texcoords": 2, "colors": 3}
+    for entry in header["meshes"]:
+        mesh = PreBlender_Mesh()
+        mesh.name = entry["name"]
+        for field, width in widths.items():
+            offset, count = entry[field]
+            setattr(mesh, field, np.frombuffer(data, dtype=np.float32, count=count * width, offset=data_start + offset * 4).reshape(count, width))
+        # Meshes are added in their original order, so indices, first_mesh_linked and the counters come out the same
+        scene_add_shape(scene, mesh, materials[entry["material"]])
+    return scene
+
+
+def read_wrl_file_cached(directory: str, filename: str, legacy_parser: bool = False, use_cache: bool = True,
+                         rebuild_cache: bool = False) -> Tuple[PreBlender_Scene, float, bool]:
+    """'read_wrl_file' with the sidecar cache in front of it.
+    use_cache=False neither reads nor writes the cache. rebuild_cache=True always parses and then rewrites the cache.
+    The legacy parser never uses the cache: it only exists to be compared against the streaming parser.
+    Returns (scene, seconds, True if the scene came from the cache). This is also what parsing worker processes run."""
+    if legacy_parser: use_cache = False
+    time_start = time.perf_counter()
+    filepath: str = os.path.join(directory, filename)
+    key: dict = None
+    time_key: float = 0
+    if use_cache:
+        key = file_key(filepath)
+        time_key = time.perf_counter() - time_start
+        if not rebuild_cache:
+            scene = load_scene_cache(cache_path(filepath), key)
+            if scene is not None:
+                scene.directory = directory
+                scene.filename = filename
+                scene.stats.add_time("cache_key", time_key)
+                scene.stats.add_time("cache_load", time.perf_counter() - time_start - time_key)
+                if lilacdogoo_blender_import_wrl.debug: print("Loaded from cache: " + cache_path(filepath))
+                return scene, time.perf_counter() - time_start, True
+
+    scene = read_wrl_file(directory, filename, legacy_parser)
+    if use_cache and scene is not None:
+        scene.stats.add_time("cache_key", time_key)
+        try:
+            with scene.stats.phase("cache_save"):
+                save_scene_cache(scene, cache_path(filepath), key)
+        except OSError as e:
+            print("    Could not write the scene cache (%s)" % e)  # The cache is only an optimization
+    return scene, time.perf_counter() - time_start, False
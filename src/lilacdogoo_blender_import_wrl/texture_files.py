@@ -0,0 +1,204 @@
+"""
+Author: LilacDogoo
+
+Everything that reads the dumped texture files directly (without Blender).
+Results are remembered in a small cache file inside the VRML directory so that re-importing into the same folder
+does not scan the same files again.
+"""
+from typing import Dict, BinaryIO, Iterable, Tuple
+
+import os
+import json
+import time
+import struct
+import hashlib
+import threading
+import concurrent.futures
+
+import numpy as np
+
+_SCAN_BLOCK_SIZE = 1 << 20  # Bytes read at once while scanning an alpha map
+
+
+def bmp_pixel_data_offset(f: BinaryIO) -> int:
+    """Reads the pixel data offset from a BMP file header. Falls back to 0x36 (the usual 24 bit BMP offset)."""
+    f.seek(0)
+    header = f.read(14)
+    if len(header) == 14 and header[:2] == b"BM":
+        return struct.unpack_from("<I", header, 10)[0]
+    return 0x36
+
+
+# Pretty hack but should work reliably.
+# Skip the header then check if every single byte after is zero.
+def is_BMP_valid_transparency(path: str) -> bool:
+    return scan_BMP_transparency(path)[0]
+
+
+def scan_BMP_transparency(path: str) -> Tuple[bool, int]:
+    """'is_BMP_valid_transparency' that also returns how many pixel bytes were read."""
+    buffer = bytearray(_SCAN_BLOCK_SIZE)
+    bytes_read: int = 0
+    with open(path, 'rb') as f:
+        f.seek(bmp_pixel_data_offset(f))
+        while True:
+            n = f.readinto(buffer)
+            if n == 0: return False, bytes_read
+            bytes_read += n
+            if np.frombuffer(buffer, dtype=np.uint8, count=n).any(): return True, bytes_read  # A byte was not zero, transparency will be activated
+
+
+def file_content_hash(path: str) -> str:
+    """Hash of the whole file. The same texels dumped under another name give the same hash."""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_SCAN_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class Texture_File_Cache:
+    """Persistent results of texture file scans. Entries are keyed by path and are only trusted while the file's
+    size and modification time are unchanged."""
+    FILENAME = "wrl_texture_cache.json"
+    VERSION = 1
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.filepath: str = os.path.join(directory, Texture_File_Cache.FILENAME)
+        self.entries: Dict[str, dict] = {}
+        self.modified: bool = False
+        self.files_scanned: int = 0  # Alpha maps that were actually read, not answered from the cache
+        self.bytes_scanned: int = 0
+        self.files_hashed: int = 0  # Same for content hashes
+        self.lock: threading.Lock = threading.Lock()  # Only guards the two counters above
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filepath, 'r', encoding='UTF-8') as f:
+                data = json.load(f)
+            if data.get("version") == Texture_File_Cache.VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}  # Missing or unreadable, start over
+
+    def save(self):
+        if not self.modified: return
+        temp_filepath = self.filepath + ".tmp"
+        try:
+            with open(temp_filepath, 'w', encoding='UTF-8') as f:
+                json.dump({"version": Texture_File_Cache.VERSION, "entries": self.entries}, f)
+            os.replace(temp_filepath, self.filepath)
+            self.modified = False
+        except OSError:
+            pass  # The cache is only an optimization. A read-only directory is not an error.
+
+    def entry(self, path: str) -> dict:
+        """Returns the (possibly new) entry of an existing file. Stale entries are reset."""
+        key = os.path.normcase(os.path.abspath(path))
+        stat = os.stat(path)
+        E = self.entries.get(key)
+        if E is None or E.get("size") != stat.st_size or E.get("mtime") != stat.st_mtime_ns:
+            E = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+            self.entries[key] = E
+            self.modified = True
+        return E
+
+    def has_transparency(self, path: str) -> bool:
+        E = self.entry(path)
+        if "alpha" not in E:
+            E["alpha"], bytes_read = scan_BMP_transparency(path)
+            self.modified = True
+            with self.lock:
+                self.files_scanned += 1
+                self.bytes_scanned += bytes_read
+        return E["alpha"]
+
+    def content_hash(self, path: str) -> str:
+        E = self.entry(path)
+        if "hash" not in E:
+            E["hash"] = file_content_hash(path)
+            self.modified = True
+            with self.lock:
+                self.files_hashed += 1
+        return E["hash"]
+
+
+class Texture_Prepass:
+    """Resolves every texture url of an import up front, on a thread pool.
+    'table' maps texture url -> (diffuse path, alpha map path). A path is None when the file does not exist, and the
+    alpha map is also None when it contains no transparency. Nothing else needs to touch the files afterwards.
+    With 'content_hashes' every existing file is also hashed: 'hashes' maps texture url -> (diffuse hash, alpha map hash)."""
+
+    def __init__(self, directory: str, texture_urls: Iterable[str], cache: Texture_File_Cache, max_workers: int = None,
+                 content_hashes: bool = False) -> None:
+        super().__init__()
+        self.directory: str = directory
+        self.cache: Texture_File_Cache = cache
+        self.content_hashes: bool = content_hashes
+        self.table: Dict[str, Tuple[str, str]] = {}
+        self.hashes: Dict[str, Tuple[str, str]] = {}
+        self.time_elapsed: float = 0  # Wall clock time of the whole pre-pass
+        self.time_serial: float = 0  # Sum of the time spent on each url, what it would have cost one at a time
+        # Seconds per kind of work ('texture_file_checks', 'alpha_scan', 'texture_hash'), summed over the threads
+        self.phases: Dict[str, float] = {}
+        self.max_workers: int = max_workers
+        self.add(texture_urls)
+
+    def add(self, texture_urls: Iterable[str]):
+        """Resolves the urls that are not in 'table' yet. For imports that only learn their urls while parsing."""
+        urls = set(url for url in texture_urls if url is not None and url not in self.table)
+        if len(urls) == 0: return
+        time_start = time.perf_counter()
+        if len(urls) == 1:
+            self._store(map(self._resolve, urls))  # Not worth starting threads for
+        else:
+            # Every url touches different files, so the cache entries never collide between threads
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                self._store(executor.map(self._resolve, urls))
+        self.time_elapsed += time.perf_counter() - time_start
+
+    def _store(self, results: Iterable[Tuple[str, Tuple[str, str], Tuple[str, str], Dict[str, float]]]):
+        for url, paths, hashes, durations in results:
+            self.table[url] = paths
+            self.hashes[url] = hashes
+            for phase, seconds in durations.items():
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+                self.time_serial += seconds
+
+    def _resolve(self, url: str) -> Tuple[str, Tuple[str, str], Tuple[str, str], Dict[str, float]]:
+        time_start = time.perf_counter()
+        path_diffuse: str = os.path.join(self.directory, url)
+        path_alpha_map: str = None
+        time_alpha_scan: float = 0
+        if not os.path.isfile(path_diffuse):
+            path_diffuse = None
+        else:
+            path_alpha_map = os.path.join(self.directory, url.replace("_c.", "_a."))
+            if not os.path.isfile(path_alpha_map):
+                path_alpha_map = None
+            else:
+                time_scan = time.perf_counter()
+                if not self.cache.has_transparency(path_alpha_map): path_alpha_map = None
+                time_alpha_scan = time.perf_counter() - time_scan
+        time_hash = time.perf_counter()
+        hashes = (None, None)
+        if self.content_hashes:
+            hashes = tuple(self.cache.content_hash(P) if P is not None else None for P in (path_diffuse, path_alpha_map))
+        time_end = time.perf_counter()
+        return url, (path_diffuse, path_alpha_map), hashes, {
+            "texture_file_checks": time_hash - time_start - time_alpha_scan,
+            "alpha_scan": time_alpha_scan,
+            "texture_hash": time_end - time_hash,
+        }
+
+    def get(self, url: str) -> Tuple[str, str]:
+        return self.table.get(url, (None, None))
+
+    def get_hashes(self, url: str) -> Tuple[str, str]:
+        return self.hashes.get(url, (None, None))
+
+    @property
+    def time_saved(self) -> float:
+        return max(0.0, self.time_serial - self.time_elapsed)
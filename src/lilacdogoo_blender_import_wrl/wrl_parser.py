@@ -0,0 +1,555 @@
+"""
+Author: LilacDogoo
+
+Reads the Nemu64 VRML dump into 'PreBlender_Scene' objects.
+Nothing in here uses Blender, so it can also run in worker processes or outside of Blender entirely.
+"""
+from typing import List, Dict, TextIO, BinaryIO, Iterator, Tuple
+
+import os
+import re
+import time
+import queue
+import hashlib
+import threading
+
+import numpy as np
+
+import lilacdogoo_blender_import_wrl
+from lilacdogoo_blender_import_wrl.import_stats import Import_Stats
+
+
+class PreBlender_Material:
+    def __init__(self) -> None:
+        super().__init__()
+        self.name: str = "NoNameAssigned"
+        self.index: int = -1
+        self.ambient_intensity: float = 1
+        self.diffuse_color: (float, float, float) = (1.0, 1.0, 1.0)
+        self.specular_color: (float, float, float) = (1.0, 1.0, 1.0)  # TODO not implemented, not sure where it is even used yet
+        self.emissive_color: (float, float, float) = (0.0, 0.0, 0.0)
+        self.alpha: float = 1
+        self.texture_url: str = None
+        self.texture_repeat: bool = True
+        self.first_mesh_linked = None
+
+    def __str__(self):
+        return self.name
+
+
+def preBlender_Material_key(M: PreBlender_Material) -> tuple:
+    # Hashable version of every field that is compared by 'preBlender_Material_equals'
+    return M.texture_url, M.texture_repeat, tuple(M.diffuse_color), tuple(M.emissive_color), M.alpha, M.ambient_intensity
+
+
+def preBlender_Material_equals(A: PreBlender_Material, B: PreBlender_Material) -> bool:
+    return preBlender_Material_key(A) == preBlender_Material_key(B)
+
+
+class PreBlender_Mesh:
+    def __init__(self) -> None:
+        super().__init__()
+        self.name = None
+        self.points: np.ndarray = np.empty((0, 3), dtype=np.float32)  # (N, 3) float32
+        self.texcoords: np.ndarray = np.empty((0, 2), dtype=np.float32)  # (N, 2) float32
+        self.colors: np.ndarray = np.empty((0, 3), dtype=np.float32)  # (N, 3) float32
+        self.material: PreBlender_Material = None
+
+    def __str__(self):
+        return self.name
+
+
+class PreBlender_Scene:
+    def __init__(self) -> None:
+        super().__init__()
+        self.directory: str = ""
+        self.filename: str = ""
+        self.materials: List[PreBlender_Material] = []
+        self.meshes: List[PreBlender_Mesh] = []
+        self.material_lookup: Dict[tuple, PreBlender_Material] = {}  # preBlender_Material_key -> Material
+        self.deduplicated_shapes: int = 0  # Shapes that reused an existing Material
+        self.stats: Import_Stats = Import_Stats()  # Parsing phases. Travels back from worker processes with the scene.
+        # Only set by 'read_wrl_file_appended': the byte range of the file the Shapes came from
+        self.start_offset: int = 0
+        self.end_offset: int = 0
+        self.head_hash: str = None
+
+
+def scene_add_material(scene: PreBlender_Scene, material: PreBlender_Material) -> PreBlender_Material:
+    """Returns the scene's Material that equals 'material', adding 'material' (with the next index) if there is none."""
+    # Search for Duplicate Material
+    key: tuple = preBlender_Material_key(material)
+    _mat_: PreBlender_Material = scene.material_lookup.get(key)
+    if _mat_ is not None:
+        scene.deduplicated_shapes += 1
+        return _mat_  # use the duplicate instead
+    # if no duplicate found then append
+    material.index = len(scene.materials)
+    scene.materials.append(material)
+    scene.material_lookup[key] = material
+    return material
+
+
+def scene_add_shape(scene: PreBlender_Scene, mesh: PreBlender_Mesh, material: PreBlender_Material):
+    # Assign Material to Mesh
+    mesh.material = scene_add_material(scene, material)
+    # Link mesh to material IF none already - For usage with some shader defaults.
+    if mesh.material.first_mesh_linked is None:
+        mesh.material.first_mesh_linked = mesh
+
+    scene.meshes.append(mesh)
+
+
+# ▬▬ STREAMING PARSER ▬▬
+# Brackets are always their own token, strings keep their quotes, commas are whitespace (as in the VRML spec) and
+# '#' comments run to the end of the line.
+_WRL_TOKEN = re.compile(rb'[{}\[\]]|"[^"\n]*"|[^\s,{}\[\]"#]+|#[^\n]*')
+
+
+class WRL_Tokenizer:
+    """Reads a file in chunks and hands out one token at a time. The whole file is never held in memory.
+    Every chunk is cut at its last newline so that no token (or comment) is ever split between two chunks."""
+
+    def __init__(self, f: BinaryIO, chunk_size: int = 1 << 20, offset: int = 0) -> None:
+        """offset: Where in the file 'f' is positioned, when reading does not start at the beginning."""
+        super().__init__()
+        self.f: BinaryIO = f
+        self.chunk_size: int = chunk_size
+        self.buffer: bytes = b""
+        self.base: int = offset  # File offset of buffer[0]
+        self.pos: int = 0
+        self.end: int = 0  # End of the region that only contains complete lines
+        self.eof: bool = False
+
+    def _fill(self) -> bool:
+        """Appends the next chunk to the unread part of the buffer. Returns False when nothing more can be read."""
+        if self.eof: return False
+        chunk = self.f.read(self.chunk_size)
+        if len(chunk) == 0:
+            self.eof = True
+            self.end = len(self.buffer)
+            return False
+        self.base += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.end = self.buffer.rfind(b"\n") + 1
+        return True
+
+    @property
+    def offset(self) -> int:
+        """File offset of the next unread byte."""
+        return self.base + self.pos
+
+    def next(self) -> bytes:
+        """Returns the next token or None at the end of the file."""
+        while True:
+            end = self.end
+            if end > self.pos:
+                m = _WRL_TOKEN.search(self.buffer, self.pos, end)
+                if m is not None:
+                    self.pos = m.end()
+                    if m.group()[0] == 0x23: continue  # '#' Comment
+                    return m.group()
+                self.pos = end
+            # At the end of the file '_fill' extends 'end' over a last line without newline, which still needs reading
+            if not self._fill() and self.pos >= self.end: return None
+
+    def read_array(self) -> bytes:
+        """Call after the opening '[' has been read. Returns everything up to the matching ']' as raw bytes and
+        consumes the ']'. This skips the tokenizer entirely so that number arrays can be bulk converted."""
+        search_from = self.pos
+        while True:
+            end = self.buffer.find(b"]", search_from)
+            if end != -1:
+                raw = self.buffer[self.pos:end]
+                self.pos = end + 1
+                return raw
+            search_from = len(self.buffer) - self.pos
+            if not self._fill():
+                raise EOFError("Unterminated '[' in WRL file")
+
+    def skip_block(self):
+        """Call after the opening '{' has been read. Skips everything up to the matching '}'."""
+        depth = 1
+        while depth > 0:
+            t = self.next()
+            if t is None: raise EOFError("Unterminated '{' in WRL file")
+            if t == b"{": depth += 1
+            elif t == b"}": depth -= 1
+            elif t == b"[": self.read_array()
+
+    def read_header(self) -> List[bytes]:
+        """Reads the tokens of a node header up to and including the opening '{'. Example: 'DEF name Appearance {'"""
+        header: List[bytes] = []
+        while True:
+            t = self.next()
+            if t is None: raise EOFError("Unterminated node header in WRL file")
+            header.append(t)
+            if t == b"{": return header
+
+
+def _wrl_header_name(header: List[bytes]) -> str:
+    # Same as the legacy parser; the name is the second token after the field name
+    return header[1].decode('UTF-8') if len(header) > 1 else None
+
+
+# Swaps Y and Z and negates the new Y so the model is upright in Blender: (x, y, z) -> (x, -z, y)
+_WRL_AXIS_ORDER = (0, 2, 1)
+_WRL_AXIS_SIGN = np.array((1.0, -1.0, 1.0), dtype=np.float32)
+
+
+def _wrl_parse_floats(raw: bytes, width: int) -> np.ndarray:
+    """Converts the contents of a number array in one call. Returns a contiguous (N, width) float32 array."""
+    values = np.fromstring(raw.replace(b",", b" "), dtype=np.float32, sep=" ")
+    return values[:len(values) - len(values) % width].reshape(-1, width)
+
+
+def _wrl_parse_material(tok: WRL_Tokenizer, material: PreBlender_Material):
+    while True:
+        t = tok.next()
+        if t is None or t == b"}": return
+        if t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        elif t == b"ambientIntensity": material.ambient_intensity = float(tok.next())
+        elif t == b"diffuseColor": material.diffuse_color = [float(tok.next()), float(tok.next()), float(tok.next())]
+        elif t == b"specularColor": material.specular_color = [float(tok.next()), float(tok.next()), float(tok.next())]
+        elif t == b"emisiveColor": material.emisive_color = [float(tok.next()), float(tok.next()), float(tok.next())]  # Same (misspelled) field as the legacy parser
+        elif t == b"shinines": material.specular = float(tok.next())
+        elif t == b"transparency": material.alpha = 1 - float(tok.next())
+
+
+def _wrl_parse_texture(tok: WRL_Tokenizer, material: PreBlender_Material):
+    while True:
+        t = tok.next()
+        if t is None or t == b"}": return
+        if t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        elif t == b"url": material.texture_url = tok.next().strip(b"\"").decode('UTF-8')
+        elif t == b"repeatS": material.texture_repeat = tok.next() == b"TRUE"
+
+
+def _wrl_parse_appearance(tok: WRL_Tokenizer, material: PreBlender_Material):
+    while True:
+        t = tok.next()
+        if t is None or t == b"}": return
+        if t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        elif t == b"material":
+            tok.read_header()
+            _wrl_parse_material(tok, material)
+        elif t == b"texture":
+            tok.read_header()
+            _wrl_parse_texture(tok, material)
+
+
+def _wrl_parse_array_field(tok: WRL_Tokenizer, field: bytes, width: int) -> np.ndarray:
+    """Parses a 'Coordinate {', 'TextureCoordinate {' or 'Color {' node and returns the values of its array field."""
+    values: np.ndarray = np.empty((0, width), dtype=np.float32)
+    while True:
+        t = tok.next()
+        if t is None or t == b"}": return values
+        if t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        elif t == field:
+            if tok.next() != b"[": raise ValueError("Expected '[' after '%s' in WRL file" % field.decode('UTF-8'))
+            values = _wrl_parse_floats(tok.read_array(), width)
+
+
+def _wrl_parse_geometry(tok: WRL_Tokenizer, mesh: PreBlender_Mesh):
+    while True:
+        t = tok.next()
+        if t is None or t == b"}": return
+        if t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        elif t == b"coord":  # Mesh Verticies
+            tok.read_header()
+            # Load Rotated so it is upright in Blender
+            mesh.points = _wrl_parse_array_field(tok, b"point", 3)[:, _WRL_AXIS_ORDER] * _WRL_AXIS_SIGN
+        elif t == b"texCoord":  # Mesh Texture Coordinates
+            tok.read_header()
+            mesh.texcoords = _wrl_parse_array_field(tok, b"point", 2)
+        elif t == b"color":  # Vertex Colors
+            tok.read_header()
+            mesh.colors = _wrl_parse_array_field(tok, b"color", 3)
+
+
+def _wrl_parse_shape(tok: WRL_Tokenizer) -> Tuple[PreBlender_Mesh, PreBlender_Material]:
+    """Call after 'Shape {' has been read. Consumes the whole Shape including its closing '}'."""
+    material = PreBlender_Material()
+    mesh = PreBlender_Mesh()
+    while True:
+        t = tok.next()
+        if t is None: raise EOFError("Unterminated Shape in WRL file")
+        if t == b"}": return mesh, material
+        if t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        elif t == b"appearance":  # Material
+            material.name = _wrl_header_name(tok.read_header())
+            _wrl_parse_appearance(tok, material)
+        elif t == b"geometry":  # Mesh
+            mesh.name = _wrl_header_name(tok.read_header())
+            _wrl_parse_geometry(tok, mesh)
+
+
+def iter_wrl_shapes(f: BinaryIO, chunk_size: int = 1 << 20, tok: WRL_Tokenizer = None) -> Iterator[Tuple[PreBlender_Mesh, PreBlender_Material]]:
+    """Yields one (mesh, material) pair per 'Shape { ... }' block. Materials are NOT deduplicated here.
+    Pass your own 'tok' to know where in the file each Shape ended ('tok.offset' right after it was yielded)."""
+    if tok is None: tok = WRL_Tokenizer(f, chunk_size)
+    t = tok.next()
+    while t is not None:
+        if t == b"Shape":
+            t = tok.next()
+            if t == b"{":
+                yield _wrl_parse_shape(tok)
+            else: continue  # Not a Shape node, look at this token again
+        elif t == b"{": tok.skip_block()
+        elif t == b"[": tok.read_array()
+        t = tok.next()
+
+
+def read_wrl_file(directory: str = "C:\\VRML\\", filename: str = "output.wrl", legacy_parser: bool = False) -> PreBlender_Scene:
+    if legacy_parser: return read_wrl_file_legacy(directory, filename)
+    scene = PreBlender_Scene()
+    scene.directory = directory
+    scene.filename = filename
+    filepath: str = os.path.join(directory, filename)
+    if lilacdogoo_blender_import_wrl.debug: print(filepath)
+    time_start = time.perf_counter()
+    time_deduplicate: float = 0
+    with open(filepath, 'rb') as f:
+        file_size: int = os.fstat(f.fileno()).st_size
+        if file_size == 0: return None
+        for mesh, material in iter_wrl_shapes(f):
+            time_add = time.perf_counter()
+            scene_add_shape(scene, mesh, material)
+            time_deduplicate += time.perf_counter() - time_add
+    scene.stats.add_time("parse", time.perf_counter() - time_start - time_deduplicate)
+    scene.stats.add_time("deduplicate_materials", time_deduplicate)
+    scene.stats.count("bytes_parsed", file_size)
+    return scene
+
+
+# ▬▬ SHAPE STREAM ▬▬
+class WRL_Shape_Stream:
+    """Parses a file on a background thread and hands out its Shapes one at a time, in file order, through a queue
+    of at most 'depth' Shapes. The parser waits while the queue is full, so only the Shapes in the queue and the one
+    being built are in memory, never the whole file.
+    Materials are deduplicated into 'scene.materials' as they arrive: every mesh comes out with its shared Material,
+    and a new Material always has the next index. 'scene.meshes' stays empty; 'shape_count' counts what came out."""
+
+    def __init__(self, directory: str, filename: str, depth: int = 16, chunk_size: int = 1 << 20) -> None:
+        super().__init__()
+        self.scene: PreBlender_Scene = PreBlender_Scene()
+        self.scene.directory = directory
+        self.scene.filename = filename
+        self.filepath: str = os.path.join(directory, filename)
+        self.file_size: int = os.path.getsize(self.filepath)
+        self.bytes_parsed: int = 0  # Up to the end of the last Shape put into the queue
+        self.shape_count: int = 0
+        self.chunk_size: int = chunk_size
+        self.shapes: queue.Queue = queue.Queue(maxsize=depth)
+        self.stop: threading.Event = threading.Event()
+        self.thread = threading.Thread(target=self._parse, daemon=True)
+        self.thread.start()
+
+    def _parse(self):
+        time_start = time.perf_counter()
+        time_waiting: float = 0
+        time_deduplicate: float = 0
+        try:
+            with open(self.filepath, 'rb') as f:
+                tok = WRL_Tokenizer(f, self.chunk_size)
+                for mesh, material in iter_wrl_shapes(f, tok=tok):
+                    time_add = time.perf_counter()
+                    mesh.material = scene_add_material(self.scene, material)
+                    time_deduplicate += time.perf_counter() - time_add
+                    self.bytes_parsed = tok.offset
+                    time_put = time.perf_counter()
+                    if not self._put(mesh): return
+                    time_waiting += time.perf_counter() - time_put
+        except Exception as e:
+            self._put(e)  # Raised again on the thread that takes the Shapes
+        finally:
+            self.scene.stats.add_time("parse", time.perf_counter() - time_start - time_waiting - time_deduplicate)
+            self.scene.stats.add_time("deduplicate_materials", time_deduplicate)
+            self.scene.stats.add_time("stream_parser_waiting", time_waiting)  # Queue full: building is the slower side
+            self.scene.stats.count("bytes_parsed", self.bytes_parsed)
+            self._put(None)
+
+    def _put(self, item) -> bool:
+        """Waits for room in the queue. Returns False if the stream was closed in the meantime."""
+        while not self.stop.is_set():
+            try:
+                self.shapes.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self) -> Iterator[PreBlender_Mesh]:
+        while True:
+            item = self.shapes.get()
+            if item is None: return
+            if isinstance(item, Exception): raise item
+            self.shape_count += 1
+            yield item
+            item = None  # Do not keep the Shape alive while waiting for the next one
+
+    def close(self):
+        """Stops the parser thread. Shapes that were not taken yet are dropped."""
+        self.stop.set()
+        self.thread.join()
+        while not self.shapes.empty(): self.shapes.get_nowait()
+
+
+# ▬▬ APPENDED SHAPES ▬▬
+_WRL_HEAD_SIZE = 1 << 16  # Bytes hashed to notice that a dump was rewritten instead of appended to
+
+
+def _wrl_head_hash(f: BinaryIO, length: int) -> str:
+    f.seek(0)
+    return hashlib.blake2b(f.read(min(length, _WRL_HEAD_SIZE)), digest_size=16).hexdigest()
+
+
+def read_wrl_file_appended(directory: str, filename: str, offset: int = 0, head_hash: str = None) -> PreBlender_Scene:
+    """Parses only the Shapes that start at or after byte 'offset', the 'end_offset' of an earlier call.
+    If the file got shorter than 'offset' or its beginning no longer matches 'head_hash' it was rewritten, and it
+    is parsed from the start instead ('start_offset' is 0 then).
+    A Shape that is still being written at the end of the file is left for the next call: 'end_offset' is right
+    after the last complete Shape."""
+    scene = PreBlender_Scene()
+    scene.directory = directory
+    scene.filename = filename
+    filepath: str = os.path.join(directory, filename)
+    if lilacdogoo_blender_import_wrl.debug: print(filepath)
+    time_start = time.perf_counter()
+    with open(filepath, 'rb') as f:
+        file_size: int = os.fstat(f.fileno()).st_size
+        if file_size == 0: return None
+        if offset > file_size or (offset > 0 and _wrl_head_hash(f, offset) != head_hash): offset = 0
+        scene.start_offset = scene.end_offset = offset
+        f.seek(offset)
+        tok = WRL_Tokenizer(f, offset=offset)
+        try:
+            for mesh, material in iter_wrl_shapes(f, tok=tok):
+                scene_add_shape(scene, mesh, material)
+                scene.end_offset = tok.offset
+        except (EOFError, TypeError, ValueError):
+            # The emulator is still writing the last Shape (TypeError/ValueError: a value was cut off). That only
+            # happens once the tokenizer ran out of file, anywhere before that the file is broken.
+            if not tok.eof: raise
+        scene.head_hash = _wrl_head_hash(f, scene.end_offset)
+    scene.stats.add_time("parse", time.perf_counter() - time_start)
+    scene.stats.count("bytes_parsed", scene.end_offset - scene.start_offset)
+    return scene
+
+
+# ▬▬ LEGACY PARSER ▬▬
+# The original line by line parser. Kept so that the streaming parser can be compared against it.
+def read_wrl_file_legacy(directory: str = "C:\\VRML\\", filename: str = "output.wrl") -> PreBlender_Scene:
+    scene = PreBlender_Scene()
+    scene.directory = directory
+    scene.filename = filename
+    filepath: str = os.path.join(directory, filename)
+    if lilacdogoo_blender_import_wrl.debug: print(filepath)
+    time_start = time.perf_counter()
+    # Begin Parsing File
+    f: TextIO = open(filepath, 'r', encoding='UTF-8')
+    content = f.readlines()
+    if len(content) == 0: return None
+    i: int = 0
+    while i < len(content):
+        s: List[str] = content[i].split()
+        if (len(s) > 0) and (s[0] == "Shape") and (s[1] == "{"):  # Shape
+            material = PreBlender_Material()
+            mesh = PreBlender_Mesh()
+            points, texcoords, colors = [], [], []
+            i += 1
+            s = content[i].split()
+            while not s[0] == "}":
+                if s[0] == "appearance":  # Material
+                    material.name = s[2]
+                    i += 1
+                    s = content[i].split()
+                    while not s[0] == "}":
+                        if s[0] == "material":  # Material Parameters
+                            i += 1
+                            s = content[i].split()
+                            while not s[0] == "}":
+                                if s[0] == "ambientIntensity": material.ambient_intensity = float(s[1])
+                                if s[0] == "diffuseColor": material.diffuse_color = [float(s[1]), float(s[2]), float(s[3])]
+                                if s[0] == "specularColor": material.specular_color = [float(s[1]), float(s[2]), float(s[3])]
+                                if s[0] == "emisiveColor": material.emisive_color = [float(s[1]), float(s[2]), float(s[3])]
+                                if s[0] == "shinines": material.specular = float(s[1])
+                                if s[0] == "transparency": material.alpha = 1 - float(s[1])
+                                i += 1
+                                s = content[i].split()
+                        elif s[0] == "texture":  # Texture Parameters
+                            i += 1
+                            s = content[i].split()
+                            while not s[0] == "}":
+                                if s[0] == "url": material.texture_url = s[1].strip("\"")
+                                if s[0] == "repeatS": material.texture_repeat = s[1] == "TRUE"
+                                i += 1
+                                s = content[i].split()
+                        i += 1
+                        s = content[i].split()
+                elif s[0] == "geometry":  # Mesh
+                    mesh.name = s[2]
+                    i += 1
+                    s = content[i].split()
+                    while not s[0] == "}":
+                        if s[0] == "coord":  # Mesh Verticies
+                            i += 1
+                            s = content[i].split()
+                            while not s[0] == "}":
+                                if s[0] == "point":
+                                    i += 1
+                                    s = content[i].split()
+                                    while not s[0] == "]":
+                                        # Load Rotated so it is upright in Blender
+                                        points.append((float(s[0]), -float(s[2].strip(",")), float(s[1])))
+                                        i += 1
+                                        s = content[i].split()
+                                i += 1
+                                s = content[i].split()
+                        elif s[0] == "texCoord":  # Mesh Texture Coordinates
+                            i += 1
+                            s = content[i].split()
+                            while not s[0] == "}":
+                                if s[0] == "point":
+                                    i += 1
+                                    s = content[i].split()
+                                    while not s[0] == "]":
+                                        texcoords.append((float(s[0]), float(s[1].strip(","))))
+                                        i += 1
+                                        s = content[i].split()
+                                i += 1
+                                s = content[i].split()
+                        elif s[0] == "color":  # Vertex Colors
+                            i += 1
+                            s = content[i].split()
+                            while not s[0] == "}":
+                                if s[0] == "color":
+                                    i += 1
+                                    s = content[i].split()
+                                    while not s[0] == "]":
+                                        colors.append((float(s[0]), float(s[1]), float(s[2].strip(","))))
+                                        i += 1
+                                        s = content[i].split()
+                                i += 1
+                                s = content[i].split()
+                        i += 1
+                        s = content[i].split()
+                i += 1
+                s = content[i].split()
+
+            mesh.points = np.array(points, dtype=np.float32).reshape(-1, 3)
+            mesh.texcoords = np.array(texcoords, dtype=np.float32).reshape(-1, 2)
+            mesh.colors = np.array(colors, dtype=np.float32).reshape(-1, 3)
+            scene_add_shape(scene, mesh, material)
+        i += 1
+    f.close()
+    scene.stats.add_time("parse_legacy", time.perf_counter() - time_start)
+    scene.stats.count("bytes_parsed", os.path.getsize(filepath))
+    return scene